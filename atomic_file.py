@@ -0,0 +1,21 @@
+# ファイルを丸ごと書き換える (音声キャッシュ・静的ファイル・索引・計測値・集計のスナップショットで共通)
+# 同じディレクトリの一時ファイルに書いてから rename するので、読み手が書きかけを掴むことはない。
+# 書けなかったときは一時ファイルを消して OSError をそのまま上げる (握りつぶすかどうかは呼び出し側で決める)。
+import os
+import tempfile
+
+
+# data は bytes / str (UTF-8 で書く)、または bytes の並び (大きなものを分けて書くとき)
+def write_atomic(path, data):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for part in [data] if isinstance(data, (bytes, bytearray, str)) else data:
+                f.write(part.encode('utf-8') if isinstance(part, str) else part)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
@@ -0,0 +1,161 @@
+# 合成済み音声のキャッシュ（メモリLRU + ディスク）
+# キーは (読み上げテキスト, 声, 出力形式) のハッシュ。全セッションで共有する。
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from atomic_file import write_atomic
+
+DEFAULT_FORMAT = "audio-24khz-48kbitrate-mono-mp3"
+AUDIO_EXT = ".mp3"
+# ディスク上の保存領域の上限。Webアプリと事前生成 (prerender.py) は同じディレクトリを使うので、どちらもこの値を使う
+# (小さい方が書き込んだときに、大きい方が作ったものまで追い出してしまう)
+DEFAULT_DISK_BUDGET = 1024 * 1024 * 1024
+
+
+def make_key(text, voice, fmt=DEFAULT_FORMAT):
+    return hashlib.sha256(f"{fmt}\n{voice}\n{text}".encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    def __init__(self, cache_dir, mem_budget=64 * 1024 * 1024, disk_budget=DEFAULT_DISK_BUDGET):
+        self.cache_dir = cache_dir
+        self.mem_budget = mem_budget
+        self.disk_budget = disk_budget
+        self._lock = threading.Lock()
+        self._mem = OrderedDict()
+        self._mem_bytes = 0
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+
+    # --- パス ---
+    def relpath_for(self, key):
+        return f"{key[:2]}/{key}{AUDIO_EXT}"
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, *self.relpath_for(key).split("/"))
+
+    # --- 取得 ---
+    def _get_memory(self, key):
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                self.hits['memory'] += 1
+            return data
+
+    def get(self, key):
+        data = self._get_memory(key)
+        if data is not None: return data
+        path = self.path_for(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # LRU判定用に更新日時を触る
+        except OSError:
+            with self._lock: self.misses += 1
+            return None
+        with self._lock:
+            self.hits['disk'] += 1
+            self._remember(key, data)
+        return data
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._mem: return True
+        return os.path.exists(self.path_for(key))
+
+    # 静的配信でURLを渡す前に、ファイルがあることを確かめる (メモリにあるかどうかでは判断しない)。
+    # あれば更新日時を触って LRU で追い出されにくくし、メモリにだけ残っていればファイルに書き戻す
+    def ensure_file(self, key):
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+            return True
+        except OSError: pass
+        with self._lock: data = self._mem.get(key)
+        if data is None: return False
+        self.put(key, data)
+        return os.path.exists(path)
+
+    # --- 保存 ---
+    def put(self, key, data):
+        if not data: return
+        with self._lock:
+            self._remember(key, data)
+        path = self.path_for(key)
+        if os.path.exists(path): return
+        try: write_atomic(path, data)
+        except OSError: return  # ディスクに書けなくてもメモリには残っている
+        with self._lock:
+            self._disk_bytes += len(data)
+            over_budget = self._disk_bytes > self.disk_budget
+        if over_budget: self._evict_disk()
+
+    def _remember(self, key, data):
+        if len(data) > self.mem_budget: return
+        old = self._mem.pop(key, None)
+        if old is not None: self._mem_bytes -= len(old)
+        self._mem[key] = data
+        self._mem_bytes += len(data)
+        while self._mem_bytes > self.mem_budget:
+            _, evicted = self._mem.popitem(last=False)
+            self._mem_bytes -= len(evicted)
+
+    # --- イベントループ (TTSService) から使うとき ---
+    # ディスクの読み書きや、上限を超えたときのディレクトリ全体の走査でループ (全セッションの合成) を止めないよう、
+    # メモリにあるもの以外はスレッドプールで行う
+    async def aget(self, key):
+        data = self._get_memory(key)
+        if data is not None: return data
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, key)
+
+    async def aput(self, key, data):
+        await asyncio.get_running_loop().run_in_executor(None, self.put, key, data)
+
+    async def acontains(self, key):
+        return await asyncio.get_running_loop().run_in_executor(None, self.__contains__, key)
+
+    # --- ディスクの容量管理 ---
+    def _scan_disk(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(AUDIO_EXT): continue
+                path = os.path.join(root, name)
+                try: info = os.stat(path)
+                except OSError: continue
+                entries.append((path, info.st_size, info.st_mtime))
+        return entries
+
+    def _evict_disk(self):
+        # 他プロセス（事前生成CLIなど）も同じディレクトリに書くので、実際の中身を数え直す
+        entries = sorted(self._scan_disk(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        low_water = int(self.disk_budget * 0.9)
+        for path, size, _ in entries:
+            if total <= low_water: break
+            try: os.remove(path)
+            except OSError: continue
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    # --- 統計 ---
+    def stats(self):
+        with self._lock:
+            hits = self.hits['memory'] + self.hits['disk']
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.hits['memory'],
+                'disk_hits': self.hits['disk'],
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._mem),
+                'memory_bytes': self._mem_bytes,
+                'disk_bytes': self._disk_bytes,
+            }
@@ -0,0 +1,50 @@
+# 問題1問分の音声を用意する (Webアプリと事前生成CLIで共通)
+# キャッシュのキーはここで決めるので、CLIで作った音声をWebアプリがそのまま使える。
+from audio_cache import DEFAULT_FORMAT, make_key
+from metrics import REGISTRY
+from segment_audio import DEFAULT_GAPS, SegmentAssembler
+from speech_text import generate_audio_text, speech_phrases
+
+SEGMENT_FORMAT_SUFFIX = "+segments"  # つなぎ合わせた音声は丸ごと合成した音声と別のキーで保存する
+
+
+# つなぎ合わせた音声はフレーズ間の無音の長さでも変わるので、それもキーに入れる (設定を変えたら作り直す)
+def segment_format(fmt=DEFAULT_FORMAT, gaps=None):
+    merged = dict(DEFAULT_GAPS, **(gaps or {}))
+    return f"{fmt}{SEGMENT_FORMAT_SUFFIX}:" + ",".join(f"{kind}={merged[kind]:g}" for kind in sorted(merged))
+
+
+def problem_audio_key(nums, voice, assemble=False, fmt=DEFAULT_FORMAT, gaps=None):
+    return make_key(generate_audio_text(nums), voice, segment_format(fmt, gaps) if assemble else fmt)
+
+
+# 同じ文章・同じ声ならキャッシュから返す
+async def get_audio_bytes(cache, backend, text, voice, fmt=DEFAULT_FORMAT, cancel_event=None):
+    key = make_key(text, voice, fmt)
+    cached = await cache.aget(key)
+    if cached is not None: return cached
+
+    audio_stream = await backend.synthesize(text, voice, cancel_event)
+    if audio_stream is None: return None
+    await cache.aput(key, audio_stream)
+    return audio_stream
+
+
+# 問題1問分の音声を用意して (キャッシュのキー, 音声) を返す
+# assemble=True ならフレーズ単位の音声をつなぎ合わせる（足りないフレーズだけ合成する）
+async def render_problem_audio(cache, backend, nums, voice, assemble=False, gaps=None, concurrency=8,
+                               fmt=DEFAULT_FORMAT, cancel_event=None, executor=None):
+    key = problem_audio_key(nums, voice, assemble, fmt, gaps)
+    if not assemble:
+        with REGISTRY.timer("stage_seconds", stage="text"): text = generate_audio_text(nums)
+        return key, await get_audio_bytes(cache, backend, text, voice, fmt, cancel_event)
+
+    audio_stream = await cache.aget(key)
+    if audio_stream is None:
+        synthesize = lambda phrase, v: backend.synthesize(phrase, v, cancel_event)
+        assembler = SegmentAssembler(cache, synthesize, gaps, concurrency, fmt, executor)
+        with REGISTRY.timer("stage_seconds", stage="text"): phrases = speech_phrases(nums)
+        with REGISTRY.timer("stage_seconds", stage="assemble"):
+            audio_stream = await assembler.assemble(phrases, voice)
+        await cache.aput(key, audio_stream)
+    return key, audio_stream
@@ -0,0 +1,63 @@
+# number_words と num2words の突き合わせ & 速度比較
+#   python benchmarks/bench_number_words.py [--samples 200000] [--seed 0]
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from num2words import num2words
+import number_words
+from number_words import number_to_words, numbers_to_words
+
+EDGE_CASES = [0, 1, 9, 10, 11, 19, 20, 21, 99, 100, 101, 110, 999, 1000, 1001, 1010, 1100,
+              10**6, 10**6 + 1, 10**9 + 10**3, 10**15 - 1, 10**16 - 1, 10**18, 10**18 + 5, 10**19 - 1,
+              number_words.LIMIT - 1]
+
+
+def reference(n):
+    return num2words(abs(n), lang='en').replace(",", "").replace(" and ", " ")
+
+
+def make_sample(count, seed):
+    rng = random.Random(seed)
+    sample = list(EDGE_CASES)
+    while len(sample) < count:
+        digits = rng.randint(1, 19)
+        sample.append(rng.choice([1, -1]) * rng.randint(10**(digits - 1), 10**digits - 1))
+    return sample
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="number_words と num2words の突き合わせ & 速度比較")
+    parser.add_argument("--samples", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sample = make_sample(args.samples, args.seed)
+
+    ref_time, expected = timed(lambda: [reference(n) for n in sample])
+    number_to_words.cache_clear()
+    new_time, actual = timed(numbers_to_words, sample)
+
+    mismatches = [(n, e, a) for n, e, a in zip(sample, expected, actual) if e != a]
+    for n, e, a in mismatches[:10]:
+        print(f"MISMATCH {n}: num2words={e!r} number_words={a!r}")
+
+    print(f"samples:            {len(sample):,}")
+    print(f"mismatches:         {len(mismatches)}")
+    print(f"num2words:          {ref_time * 1e6 / len(sample):8.2f} us/number")
+    print(f"number_words:       {new_time * 1e6 / len(sample):8.2f} us/number  (x{ref_time / new_time:.1f})")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
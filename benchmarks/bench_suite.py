@@ -0,0 +1,315 @@
+# オフラインで回せるベンチマーク一式 (ネットワーク不要: 読み上げはローカルの偽サーバー fake_tts_server を使う)
+# 結果は JSON で benchmarks/results/ に残すので、--compare で前回の結果と比べられる。
+#   python benchmarks/bench_suite.py                       # すべて
+#   python benchmarks/bench_suite.py --quick               # 小さめの規模で
+#   python benchmarks/bench_suite.py --only csv audio      # 一部だけ
+#   python benchmarks/bench_suite.py --tts-latency 0.4 --compare benchmarks/results/20260101-120000.json
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from audio_cache import AudioCache
+from audio_render import render_problem_audio
+from learner_stats import RECORD, LearnerStats, voice_code
+from fake_tts_server import FakeTTSServer, point_edge_tts_at
+from number_words import number_to_words, numbers_to_words
+from problem_catalog import ProblemCatalog
+from problem_generator import ProblemGenerator, deal_digits, generate_problems, problem_from_digits, write_problem_csv
+from speech_text import generate_audio_text, speech_phrases
+from static_assets import StaticAssets
+from tts_backend import EdgeTTSBackend, ResilientBackend, TTSService
+from voices import VOICE_IDS
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DIGIT_RANGES = [(1, 4), (7, 14), (1, 16), (16, 16)]
+ROW_COUNTS = [3, 5, 15]
+CSV_SIZES = [30, 1000, 50000, 500000]
+# Webアプリ (web_trainer.py) が起動時に読み込むモジュール。streamlit はサーバーが先に読み込んでいるので別に測る
+APP_MODULES = ["audio_render", "exam_audio", "audio_cache", "metrics", "problem_catalog", "problem_generator",
+               "segment_audio", "session_store", "static_assets", "tts_backend", "voices"]
+
+
+class Recorder:
+    def __init__(self):
+        self.results = []
+
+    def add(self, bench, case, value, unit, **extra):
+        self.results.append({'bench': bench, 'case': case, 'value': value, 'unit': unit, **extra})
+        detail = "  ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in extra.items())
+        print(f"  {bench:<8} {case:<44} {value:12.2f} {unit:<12} {detail}", flush=True)
+
+
+def per_call_us(func, count):
+    started = time.perf_counter()
+    for _ in range(count): func()
+    return (time.perf_counter() - started) * 1e6 / count
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99)}
+
+
+# --- 問題の生成 ---
+def bench_problems(rec, quick):
+    count = 300 if quick else 3000
+    batch = 2000 if quick else 20000
+    for min_d, max_d in DIGIT_RANGES:
+        for rows in ROW_COUNTS:
+            for sub in (False, True):
+                case = f"digits={min_d}-{max_d} rows={rows} sub={int(sub)}"
+                deck = []
+
+                def one():
+                    nonlocal deck
+                    digits, deck = deal_digits(deck, rows, min_d, max_d)
+                    problem_from_digits(digits, sub)
+
+                rec.add("problems", "single " + case, per_call_us(one, count), "us/problem")
+                generator = ProblemGenerator(min_d, max_d, rows, sub, seed=0)
+                started = time.perf_counter()
+                generator.generate(batch)
+                rec.add("problems", "batch " + case, (time.perf_counter() - started) * 1e6 / batch, "us/problem")
+    for rows in ROW_COUNTS:
+        deck = []
+
+        def deal():
+            nonlocal deck
+            _, deck = deal_digits(deck, rows, 1, 16)
+
+        rec.add("deck", f"deal rows={rows} digits=1-16", per_call_us(deal, count * 10), "us/call")
+
+
+# --- 読み上げテキスト ---
+def bench_speech(rec, quick):
+    count = 500 if quick else 5000
+    rng = random.Random(0)
+    for digits in (4, 14, 16):
+        for rows in ROW_COUNTS:
+            problems = [[rng.randint(10**(digits - 1), 10**digits - 1) for _ in range(rows)] for _ in range(count)]
+            for name, func in (("generate_audio_text", generate_audio_text), ("speech_phrases", speech_phrases)):
+                number_to_words.cache_clear()
+                it = iter(problems)
+                rec.add("speech", f"{name} digits={digits} rows={rows}", per_call_us(lambda: func(next(it)), count), "us/problem")
+    sample = [rng.randint(1, 10**16) for _ in range(20000 if not quick else 2000)]
+    number_to_words.cache_clear()
+    started = time.perf_counter()
+    numbers_to_words(sample)
+    rec.add("speech", "numbers_to_words cold", (time.perf_counter() - started) * 1e6 / len(sample), "us/number")
+
+
+# --- 問題CSV (load_problems_from_csv / get_problem_counts の中身) ---
+def bench_csv(rec, quick):
+    sizes = [n for n in CSV_SIZES if not quick or n <= 50000]
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir, index_dir = os.path.join(tmp, "data"), os.path.join(tmp, "index")
+        os.makedirs(data_dir)
+        for size in sizes:
+            name = f"p{size}.csv"
+            write_problem_csv(os.path.join(data_dir, name), generate_problems(size, 7, 14, 5, True, seed=size))
+        for size in sizes:
+            name = f"p{size}.csv"
+            file_mb = os.path.getsize(os.path.join(data_dir, name)) / 1024**2
+            for use_mmap in (False, True):
+                tag = f"n={size} mmap={int(use_mmap)}"
+                catalog = ProblemCatalog(data_dir, min_interval=0, index_dir=index_dir, use_mmap=use_mmap)
+
+                started = time.perf_counter()
+                problems = catalog.get(name)
+                rec.add("csv", f"load cold {tag}", (time.perf_counter() - started) * 1e3, "ms", mb=file_mb)
+                started = time.perf_counter()
+                ProblemCatalog(data_dir, index_dir=index_dir, use_mmap=use_mmap).get(name)
+                rec.add("csv", f"load reopen {tag}", (time.perf_counter() - started) * 1e3, "ms")
+                rec.add("csv", f"get warm {tag}", per_call_us(lambda: catalog.get(name), 200), "us/call")
+                numbers = list(problems)
+                rng = random.Random(0)
+                rec.add("csv", f"row lookup {tag}", per_call_us(lambda: problems[rng.choice(numbers)], 2000), "us/row")
+                rec.add("csv", f"summary {tag}", per_call_us(problems.summary, 3), "us/call")
+                shutil.rmtree(index_dir, ignore_errors=True)  # 次は索引なしの状態から測る
+        catalog = ProblemCatalog(data_dir, min_interval=0, index_dir=index_dir)
+        started = time.perf_counter()
+        catalog.counts()
+        rec.add("csv", f"counts cold files={len(sizes)}", (time.perf_counter() - started) * 1e3, "ms")
+        rec.add("csv", f"counts warm files={len(sizes)}", per_call_us(catalog.counts, 200), "us/call")
+
+
+# --- 音声 (偽の読み上げサーバー越しに、再生ボタン1回分) ---
+def bench_audio(rec, quick, tts_latency, tts_jitter):
+    clicks = 8 if quick else 24
+    server = FakeTTSServer(first_byte=tts_latency, jitter=tts_jitter, seed=0)
+    point_edge_tts_at(server.start_in_thread())
+    service = TTSService(ResilientBackend(EdgeTTSBackend(), limit=16, timeout=30, retries=2))
+    rng = random.Random(0)
+    problems = [[rng.randint(10**6, 10**14) for _ in range(5)] for _ in range(clicks)]
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = AudioCache(tmp, mem_budget=64 * 1024**2)
+
+            def click(nums, assemble=False):
+                started = time.perf_counter()
+                _, audio = service.run(render_problem_audio(cache, service.backend, nums, "en-US-JennyNeural", assemble))
+                base64.b64encode(audio)  # キャッシュを静的配信しない設定のときに払う分
+                return time.perf_counter() - started
+
+            for case, assemble, runs in (("whole cold", False, problems), ("whole warm", False, problems),
+                                         ("segments cold", True, problems), ("segments warm", True, problems)):
+                samples = [click(nums, assemble) * 1e3 for nums in runs]
+                rec.add("audio", f"play click {case} latency={tts_latency}", statistics.median(samples), "ms",
+                        **{k: v for k, v in percentiles(samples).items() if k != 'p50'})
+
+            # 解答中に次の問題を先読みしておいた場合 (考える時間は 1 秒)
+            samples = []
+            fresh = [[rng.randint(10**6, 10**14) for _ in range(5)] for _ in range(clicks)]
+            for nums in fresh:
+                future = service.submit(render_problem_audio(cache, service.backend, nums, "en-US-JennyNeural"))
+                time.sleep(1.0)
+                started = time.perf_counter()
+                future.result()
+                samples.append((time.perf_counter() - started) * 1e3 + click(nums) * 1e3)
+            rec.add("audio", f"play click prefetched latency={tts_latency}", statistics.median(samples), "ms",
+                    **{k: v for k, v in percentiles(samples).items() if k != 'p50'})
+
+            # 同時に用意する数を増やしたときの、問題1問あたりの時間
+            for width in (1, 4, 16):
+                batch = [[rng.randint(10**6, 10**14) for _ in range(5)] for _ in range(width * 2)]
+
+                async def render_all():
+                    await asyncio.gather(*(render_problem_audio(cache, service.backend, nums, "en-US-GuyNeural") for nums in batch))
+
+                started = time.perf_counter()
+                service.run(render_all())
+                rec.add("audio", f"render x{len(batch)} concurrent latency={tts_latency}",
+                        (time.perf_counter() - started) * 1e3 / len(batch), "ms/problem")
+    finally:
+        service.close()
+        server.stop_thread()
+
+
+# --- 起動 (新しいプロセスでの import と、静的ファイルの準備) ---
+def bench_startup(rec, quick):
+    runs = 3 if quick else 10
+    script = ("import sys, time; sys.path.insert(0, sys.argv[1]); started = time.perf_counter(); {imports}; "
+              "print(time.perf_counter() - started, 'numpy' in sys.modules)")
+    for case, imports in (("import streamlit", "import streamlit"),
+                          ("import app modules", "import streamlit; started = time.perf_counter(); import " + ", ".join(APP_MODULES))):
+        samples, numpy_loaded = [], False
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, "-c", script.format(imports=imports), ROOT], capture_output=True, text=True, check=True).stdout.split()
+            samples.append(float(out[0]) * 1e3)
+            numpy_loaded = out[1] == "True"
+        rec.add("startup", case, statistics.median(samples), "ms", max=max(samples), numpy=int(numpy_loaded))
+
+    try:
+        from PIL import Image
+    except ImportError:
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        image_path = os.path.join(tmp, "background.png")
+        Image.effect_noise((2400, 1600), 64).convert("RGB").save(image_path)
+        assets = StaticAssets(os.path.join(tmp, "assets"), "app/static/assets/")
+        for case in ("cold", "warm"):
+            started = time.perf_counter()
+            _, variants = assets.publish(image_path, (960, 1920))
+            rec.add("startup", f"publish background {case}", (time.perf_counter() - started) * 1e3, "ms",
+                    png_kb=os.path.getsize(image_path) / 1024,
+                    **{f"w{width}_kb": os.path.getsize(os.path.join(tmp, "assets", url.rsplit("/", 1)[1])) / 1024 for width, url in variants.items()})
+
+
+# --- 答え合わせの記録と集計 ---
+def bench_stats(rec, quick):
+    history = 50000 if quick else 500000
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        # 過去の記録 (200日分) をまとめて作っておく
+        now = time.time()
+        for day in range(200):
+            ts = now - 86400 * (day + 1)
+            records = (RECORD.pack(ts, rng.getrandbits(48), no, rng.randint(2000, 30000), voice_code(rng.choice(VOICE_IDS)),
+                                   7, rng.randint(7, 14), rng.choice(ROW_COUNTS), rng.random() < 0.5, rng.choice((10, 15)),
+                                   rng.random() < 0.7, 1, 0) for no in range(history // 200))
+            with open(os.path.join(tmp, f"attempts-{time.strftime('%Y%m%d', time.localtime(ts))}.bin"), 'ab') as f:
+                f.write(b"".join(records))
+
+        started = time.perf_counter()
+        stats = LearnerStats(tmp)
+        rec.add("stats", f"open rebuild n={history}", (time.perf_counter() - started) * 1e3, "ms")
+        stats.save_snapshot()
+        started = time.perf_counter()
+        stats = LearnerStats(tmp)
+        rec.add("stats", f"open from snapshot n={history}", (time.perf_counter() - started) * 1e3, "ms")
+
+        nums = [rng.randint(10**6, 10**13) for _ in range(5)]
+        rec.add("stats", f"record n={history}", per_call_us(
+            lambda: stats.record("abcdef123456", 1, nums, "en-US-JennyNeural", 1.0, True, 8.0), 2000), "us/attempt")
+        for dimension in ("all", "digits", "voice"):
+            rec.add("stats", f"query {dimension} n={history}", per_call_us(lambda: stats.query(dimension), 50), "us/call")
+        rec.add("stats", f"query digits last 7 days n={history}",
+                per_call_us(lambda: stats.query("digits", since=time.strftime("%Y%m%d", time.localtime(now - 7 * 86400))), 50), "us/call")
+
+
+BENCHES = {'problems': bench_problems, 'speech': bench_speech, 'csv': bench_csv, 'audio': bench_audio, 'startup': bench_startup, 'stats': bench_stats}
+
+
+def git_commit():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError: return None
+
+
+def compare(results, path):
+    with open(path, encoding='utf-8') as f: previous = {(r['bench'], r['case']): r for r in json.load(f)['results']}
+    print(f"\n前回 ({path}) との比較 (値が小さいほど速い):")
+    for r in results:
+        old = previous.get((r['bench'], r['case']))
+        if not old or not old['value']: continue
+        ratio = r['value'] / old['value']
+        mark = "  <-- 遅くなった" if ratio > 1.1 else "  <-- 速くなった" if ratio < 0.9 else ""
+        print(f"  {r['bench']:<8} {r['case']:<44} {old['value']:12.2f} -> {r['value']:12.2f} {r['unit']:<12} x{ratio:.2f}{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="オフラインで回せるベンチマーク一式")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHES), help="回すベンチマーク (省略時はすべて)")
+    parser.add_argument("--quick", action="store_true", help="小さめの規模で回す")
+    parser.add_argument("--tts-latency", type=float, default=0.2, help="偽の読み上げサーバーが最初の音声を返すまでの時間 (秒)")
+    parser.add_argument("--tts-jitter", type=float, default=0.05, help="その時間のゆらぎ (± 秒)")
+    parser.add_argument("--output", help="結果のJSONの保存先 (省略時は benchmarks/results/日時.json)")
+    parser.add_argument("--compare", metavar="JSON", help="前回の結果と比べる")
+    args = parser.parse_args()
+
+    rec = Recorder()
+    started = time.time()
+    for name in args.only or list(BENCHES):
+        print(f"[{name}]", flush=True)
+        if name == "audio": bench_audio(rec, args.quick, args.tts_latency, args.tts_jitter)
+        else: BENCHES[name](rec, args.quick)
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    meta = {
+        'started': started, 'elapsed': time.time() - started, 'commit': git_commit(),
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        'quick': args.quick, 'tts_latency': args.tts_latency, 'tts_jitter': args.tts_jitter,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'results': rec.results}, f, ensure_ascii=False, indent=1)
+    print(f"\n結果: {output}")
+    if args.compare: compare(rec.results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
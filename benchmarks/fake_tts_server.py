@@ -0,0 +1,144 @@
+# edge-tts の代わりに使うローカルの偽の読み上げサーバー (ベンチマーク・負荷試験用)
+# edge-tts と同じ WebSocket のやりとりで、文字数に比例した長さの無音 MP3 を返す。
+# 最初の音声が届くまでの待ち時間 (first_byte ± jitter)、送る速さ (realtime: 再生時間の何倍の速さで送るか)、
+# 失敗させる割合 (error_rate) を指定できる。
+#
+#   python benchmarks/fake_tts_server.py --port 8765 --first-byte 0.3 --jitter 0.1
+#
+# 使う側は point_edge_tts_at(url) で edge-tts の接続先を差し替える。
+import argparse
+import asyncio
+import html
+import os
+import random
+import re
+import sys
+import threading
+
+from aiohttp import WSMsgType, web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segment_audio import silence
+
+WS_PATH = "/consumer/speech/synthesize/readaloud/edge/v1"
+BYTES_PER_SECOND = 48000 // 8  # audio-24khz-48kbitrate-mono-mp3
+_SSML_TEXT = re.compile(r"<prosody[^>]*>(.*)</prosody>", re.S)
+_REQUEST_ID = re.compile(r"X-RequestId:(\w+)")
+
+
+class FakeTTSServer:
+    def __init__(self, first_byte=0.2, jitter=0.0, realtime=20.0, chunk_bytes=4096, error_rate=0.0,
+                 seconds_per_char=0.06, seed=None):
+        self.first_byte = first_byte
+        self.jitter = jitter
+        self.realtime = realtime
+        self.chunk_bytes = chunk_bytes
+        self.error_rate = error_rate
+        self.seconds_per_char = seconds_per_char
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.active = 0
+        self.peak_active = 0
+        self.url = None
+        self._runner = None
+        self._loop = None
+
+    async def _handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.requests += 1
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            text = request_id = None
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT: continue
+                headers, _, body = msg.data.partition("\r\n\r\n")
+                if "Path:ssml" in headers:
+                    match = _SSML_TEXT.search(body)
+                    text = html.unescape(match.group(1)) if match else ""
+                    match = _REQUEST_ID.search(headers)
+                    request_id = match.group(1) if match else "0"
+                    break
+            if text is None: return ws
+
+            await asyncio.sleep(max(0.0, self.first_byte + self.rng.uniform(-self.jitter, self.jitter)))
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.errors += 1
+                await ws.close(code=1011)
+                return ws
+
+            audio = silence(max(0.1, len(text) * self.seconds_per_char))
+            header = f"X-RequestId:{request_id}\r\nContent-Type:audio/mpeg\r\nPath:audio\r\n".encode()
+            interval = self.chunk_bytes / BYTES_PER_SECOND / self.realtime if self.realtime else 0.0
+            try:
+                for pos in range(0, len(audio), self.chunk_bytes):
+                    if pos and interval: await asyncio.sleep(interval)
+                    await ws.send_bytes(len(header).to_bytes(2, "big") + header + audio[pos:pos + self.chunk_bytes])
+                await ws.send_str(f"X-RequestId:{request_id}\r\nPath:turn.end\r\n\r\n{{}}")
+            except ConnectionResetError:
+                return ws  # 送っている途中でクライアントが諦めた (タイムアウトや取り消し)
+            async for _ in ws: pass  # クライアントが閉じるまで待つ
+        finally:
+            self.active -= 1
+        return ws
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_get(WS_PATH, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"ws://{host}:{port}{WS_PATH}"
+        return self.url
+
+    async def stop(self):
+        if self._runner: await self._runner.cleanup()
+
+    # 別スレッドのイベントループで動かす (呼び出し側のループを邪魔しない)
+    def start_in_thread(self, host="127.0.0.1", port=0):
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="fake-tts", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(self.start(host, port), self._loop).result()
+
+    def stop_thread(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def stats(self):
+        return {'requests': self.requests, 'errors': self.errors, 'active': self.active, 'peak_active': self.peak_active}
+
+
+# edge-tts (EdgeTTSBackend) の接続先をこのサーバーに向ける
+def point_edge_tts_at(url):
+    import edge_tts.communicate
+    edge_tts.communicate.WSS_URL = f"{url}?TrustedClientToken=fake"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="edge-tts の代わりに使うローカルの偽の読み上げサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-byte", type=float, default=0.2, help="最初の音声を返すまでの待ち時間 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="待ち時間のゆらぎ (± 秒)")
+    parser.add_argument("--realtime", type=float, default=20.0, help="再生時間の何倍の速さで送るか (0 で一度に送る)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="接続を切って失敗させる割合")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = FakeTTSServer(args.first_byte, args.jitter, args.realtime, error_rate=args.error_rate, seed=args.seed)
+
+    async def run():
+        print(f"listening on {await server.start(args.host, args.port)}", flush=True)
+        await asyncio.Event().wait()
+
+    try: asyncio.run(run())
+    except KeyboardInterrupt: pass
+
+
+if __name__ == "__main__":
+    main()
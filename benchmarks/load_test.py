@@ -0,0 +1,378 @@
+# 複数の生徒が同時に使ったときの負荷試験
+# 本物の Streamlit サーバーを別プロセスで立ち上げ、ブラウザの代わりに N 個のセッションを WebSocket でつなぐ。
+# 各セッションは 再生 / もう一度再生 / 声の切り替え / 次の問題 / 答え合わせ を、考える時間を挟みながら繰り返す。
+# プレーヤーが出たら、ブラウザと同じく静的配信 (app/static/audio/) の音声ファイルも取りに行き、200 で返ることを確かめる。
+# 読み上げはローカルの偽サーバー (fake_tts_server) なので、ネットワークは使わない。
+#
+#   python benchmarks/load_test.py --sessions 50 --duration 120
+#   python benchmarks/load_test.py --sessions 200 --ramp 60 --tts-latency 0.4 --output /tmp/load.json
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_tts_server import FakeTTSServer, point_edge_tts_at
+
+APP = os.path.join(ROOT, "web_trainer.py")
+AUDIO_DIR = os.path.join(ROOT, "static", "audio")  # アプリが音声を置き、静的配信で配る場所 (web_trainer.AUDIO_CACHE_DIR)
+LOAD_TEST_FORMAT = "+loadtest"  # 偽の読み上げの音声を本物と別のキーにして、本物の音声として配られないようにする
+ACTIONS = ("start", "play", "replay", "voice", "next", "answer", "audio")
+_TOTAL = re.compile(r"Total: ([-\d,]+)")
+_AUDIO_SRC = re.compile(r'<source src="([^"]+)"')
+
+
+# --- サーバー側 (別プロセス) ---
+def serve(args):
+    point_edge_tts_at(args.tts_url)
+    import audio_cache
+    audio_cache.DEFAULT_FORMAT += LOAD_TEST_FORMAT  # アプリ (web_trainer.AUDIO_FORMAT) が読み込む前に差し替える
+    os.chdir(args.workdir)
+    from streamlit.web import bootstrap
+    options = {'server_port': args.port, 'server_headless': True,
+               'server_fileWatcherType': "none", 'browser_gatherUsageStats': False}
+    bootstrap.load_config_options(flag_options=options)
+    bootstrap.run(APP, False, [], options)
+
+
+def audio_files():
+    for root, _, files in os.walk(AUDIO_DIR):
+        for name in files: yield os.path.join(root, name)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError): return 0
+
+
+def wait_until_healthy(base_url, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None: raise RuntimeError(f"Streamlit サーバーが終了しました (終了コード {server.returncode})")
+        try:
+            with urllib.request.urlopen(base_url + "/_stcore/health", timeout=1) as response:
+                if response.status == 200: return
+        except OSError: pass
+        time.sleep(0.2)
+    raise TimeoutError(f"Streamlit サーバーが {timeout} 秒以内に起動しませんでした")
+
+
+# --- ブラウザの代わり ---
+class StreamlitSession:
+    # Streamlit の WebSocket (protobuf) を直接話す最小限のクライアント
+    def __init__(self, http, base_url):
+        self.http = http
+        self.base_url = base_url
+        self.url = base_url.replace("http", "ws", 1) + "/_stcore/stream"
+        self.ws = None
+        self.elements = {}  # delta_path -> (種類, proto, fragment_id)
+        self.widget_values = {}  # 変更したウィジェットの値 (毎回送る)
+        self.page_hash = ""
+        self.bytes_received = 0
+        self.audio_bytes = 0
+
+    async def connect(self):
+        self.ws = await self.http.ws_connect(self.url, protocols=["streamlit"], max_msg_size=0)
+
+    async def close(self):
+        if self.ws: await self.ws.close()
+
+    # fragment_id を付けると、ブラウザと同じくその部分 (st.fragment) だけを再実行させる
+    async def rerun(self, values=None, trigger=None, fragment_id=""):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        for widget_id, (field, value) in (values or {}).items():
+            self.widget_values[widget_id] = (field, value)
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = self.page_hash
+        msg.rerun_script.fragment_id = fragment_id
+        for widget_id, (field, value) in self.widget_values.items():
+            state = msg.rerun_script.widget_states.widgets.add()
+            state.id = widget_id
+            if field == "string_array_value": state.string_array_value.data.extend(value)
+            else: setattr(state, field, value)
+        if trigger:
+            state = msg.rerun_script.widget_states.widgets.add()
+            state.id, state.trigger_value = trigger, True
+        await self.ws.send_bytes(msg.SerializeToString())
+
+        while True:
+            received = await self.ws.receive()
+            if received.type != aiohttp.WSMsgType.BINARY: raise ConnectionError(f"WebSocket closed: {received.type}")
+            self.bytes_received += len(received.data)
+            fwd = ForwardMsg()
+            fwd.ParseFromString(received.data)
+            kind = fwd.WhichOneof("type")
+            if kind == "new_session":
+                self.page_hash = fwd.new_session.main_script_hash
+            elif kind == "session_status_changed" and fwd.session_status_changed.script_is_running and not fragment_id:
+                self.elements = {}
+            elif kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                element = fwd.delta.new_element
+                element_type = element.WhichOneof("type")
+                self.elements[tuple(fwd.metadata.delta_path)] = (element_type, getattr(element, element_type), fwd.delta.fragment_id)
+            elif kind == "script_finished" and fwd.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return
+
+    # --- 画面の中身を探す ---
+    def find(self, element_type, label_prefix=""):
+        return self.locate(element_type, label_prefix)[0]
+
+    def locate(self, element_type, label_prefix=""):
+        for kind, proto, fragment_id in self.elements.values():
+            if kind == element_type and proto.label.startswith(label_prefix): return proto, fragment_id
+        return None, None
+
+    def texts(self, element_type):
+        return [proto.body for kind, proto, _ in self.elements.values() if kind == element_type]
+
+    # プレーヤーに渡された音声の URL (base64 で埋め込まれていれば None)
+    def audio_url(self):
+        for kind, proto, _ in self.elements.values():
+            if kind != "iframe": continue
+            m = _AUDIO_SRC.search(proto.srcdoc)
+            if m and not m.group(1).startswith("data:"): return m.group(1)
+        return None
+
+    async def fetch(self, path):
+        async with self.http.get(f"{self.base_url}/{path}") as response:
+            data = await response.read()
+            if response.status != 200: raise ConnectionError(f"音声を取得できませんでした (HTTP {response.status}): {path}")
+        self.audio_bytes += len(data)
+
+    async def click(self, label_prefix, values=None):
+        button, fragment_id = self.locate("button", label_prefix)
+        if button is None: raise LookupError(f"ボタンが見つかりません: {label_prefix}")
+        await self.rerun(values, trigger=button.id, fragment_id=fragment_id)
+
+    async def choose(self, element_type, label_prefix, option):
+        widget = self.find(element_type, label_prefix)
+        await self.rerun({widget.id: ("string_value", option)})
+
+
+class Learner:
+    # 生徒1人分。CSVモードとランダム生成モードを半々にする
+    def __init__(self, index, session, stats, think, rng):
+        self.index = index
+        self.session = session
+        self.stats = stats
+        self.think = think
+        self.rng = rng
+        self.csv_mode = index % 2 == 1
+        self.last_audio = None
+
+    async def timed(self, action, step):
+        started = time.perf_counter()
+        await step
+        self.stats[action].append(time.perf_counter() - started)
+
+    async def pause(self):
+        await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.think)
+
+    # 新しい音声の URL が出ていたら取りに行く (同じ URL はブラウザのキャッシュにあるものとして取り直さない)
+    async def listen(self):
+        url = self.session.audio_url()
+        if url is None or url == self.last_audio: return
+        self.last_audio = url
+        await self.timed("audio", self.session.fetch(url))
+
+    async def start(self):
+        async def step():
+            await self.session.connect()
+            await self.session.rerun()
+            voices = self.session.find("selectbox", "話者の声").options
+            await self.session.choose("selectbox", "話者の声", voices[1 + self.index % (len(voices) - 1)])
+            if self.csv_mode: await self.session.choose("radio", "📁 モード", "CSV読み込み")
+        await self.timed("start", step())
+
+    async def switch_voice(self):
+        voice_box = self.session.find("selectbox", "話者の声")
+        await self.timed("voice", self.session.choose("selectbox", "話者の声", self.rng.choice(voice_box.options[1:])))
+
+    async def answer(self):
+        totals = [int(m.group(1).replace(",", "")) for body in self.session.texts("markdown") for m in _TOTAL.finditer(body)]
+        field = self.session.find("text_input", "答えを入力")
+        if not totals or field is None: return
+        answer = totals[0] if self.rng.random() < 0.7 else totals[0] + 1
+        await self.timed("answer", self.session.click("答え合わせ", {field.id: ("string_value", str(answer))}))
+
+    async def next_problem(self):
+        if not self.csv_mode:
+            await self.timed("next", self.session.click("🆕"))
+            return
+
+        async def step():
+            selector = self.session.find("number_input", "📝 問題番号")
+            current = selector.value if selector.set_value else selector.default
+            await self.session.rerun({selector.id: ("double_value", min(current + 1, selector.max))})
+            await self.session.click("▶️")
+        await self.timed("next", step())
+
+    # 1問分の流れ: 聞く → (ときどき聞き直す / 声を変える) → 答える → 次の問題
+    async def run(self, deadline):
+        await self.start()
+        await self.timed("play", self.session.click("▶️"))
+        await self.listen()
+        while time.monotonic() < deadline:
+            await self.pause()
+            roll = self.rng.random()
+            # ランダム生成モードの聞き直しはブラウザ内の再生だけなので、サーバーには届かない
+            if roll < 0.15 and self.session.find("button", "▶️"): await self.timed("replay", self.session.click("▶️"))
+            elif roll < 0.25: await self.switch_voice()
+            await self.listen()
+            await self.pause()
+            await self.answer()
+            await self.pause()
+            await self.next_problem()
+            await self.listen()
+
+
+def summarize(values):
+    if not values: return {'count': 0}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {'count': len(values), 'mean_ms': statistics.fmean(values) * 1000,
+            'p50_ms': pick(0.5), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99), 'max_ms': ordered[-1] * 1000}
+
+
+async def drive(args, base_url, server_pid, tts):
+    stats = {action: [] for action in ACTIONS}
+    errors = []
+    rss = []
+    started = time.monotonic()
+    deadline = started + args.ramp + args.duration
+    sessions = []
+
+    async def learner(index):
+        await asyncio.sleep(args.ramp * index / max(1, args.sessions))
+        session = StreamlitSession(http, base_url)
+        sessions.append(session)
+        try:
+            await Learner(index, session, stats, args.think, random.Random(args.seed * 100003 + index)).run(deadline)
+        except Exception as e:
+            errors.append({'session': index, 'error': f"{type(e).__name__}: {e}"})
+        finally:
+            await session.close()
+
+    async def monitor():
+        while True:
+            rss.append(rss_bytes(server_pid))
+            await asyncio.sleep(0.5)
+
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=args.timeout)
+    async with aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(limit=0)) as http:
+        watcher = asyncio.create_task(monitor())
+        await asyncio.gather(*(learner(i) for i in range(args.sessions)))
+        watcher.cancel()
+    elapsed = time.monotonic() - started
+    total_actions = sum(len(v) for v in stats.values())
+    return {
+        'config': {k: v for k, v in vars(args).items() if k != 'func'},
+        'elapsed_s': elapsed,
+        'actions': total_actions,
+        'throughput_per_s': total_actions / elapsed,
+        'latency': {action: summarize(values) for action, values in stats.items()},
+        'rss_start_mb': (rss[0] if rss else 0) / 1024**2,
+        'rss_peak_mb': max(rss + [0]) / 1024**2,
+        'rss_end_mb': rss_bytes(server_pid) / 1024**2,
+        'received_mb_per_session': statistics.fmean([s.bytes_received for s in sessions]) / 1024**2 if sessions else 0,
+        'audio_mb_per_session': statistics.fmean([s.audio_bytes for s in sessions]) / 1024**2 if sessions else 0,
+        'peak_concurrent_synth': tts.peak_active,
+        'tts_requests': tts.requests,
+        'tts_errors': tts.errors,
+        'errors': errors,
+    }
+
+
+def run_load(args):
+    tts = FakeTTSServer(args.tts_latency, args.tts_jitter, error_rate=args.tts_error_rate, seed=args.seed)
+    tts_url = tts.start_in_thread()
+
+    # 記録や計測値は作業用ディレクトリに作る。音声はアプリと同じ static/audio/ に置かれるので (そこからしか配られない)、
+    # 終わったらこの試験で増えたものを消す (キーが本物と違うので、試験中に本物の音声として配られることはない)
+    workdir = tempfile.mkdtemp(prefix="yomiage-load-")
+    os.symlink(os.path.join(ROOT, "data"), os.path.join(workdir, "data"))
+    existing = set(audio_files())
+    shutil.copytree(os.path.join(ROOT, ".streamlit"), os.path.join(workdir, ".streamlit"))
+    port = args.port or free_port()
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--port", str(port),
+                               "--tts-url", tts_url, "--workdir", workdir],
+                              stdout=subprocess.DEVNULL, stderr=open(os.path.join(workdir, "server.log"), 'w'))
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_healthy(base_url, server)
+        print(f"{args.sessions} セッションで負荷をかけます (立ち上がり {args.ramp:.0f}s + {args.duration:.0f}s, サーバー pid {server.pid})", flush=True)
+        result = asyncio.run(drive(args, base_url, server.pid, tts))
+    finally:
+        server.terminate()
+        server.wait()
+        tts.stop_thread()
+        if args.keep_workdir: print(f"作業用ディレクトリ: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+            for path in set(audio_files()) - existing:
+                try: os.remove(path)
+                except OSError: pass
+
+    print(f"\n経過 {result['elapsed_s']:.1f}s / 操作 {result['actions']} 回 ({result['throughput_per_s']:.2f} 回/s) / エラー {len(result['errors'])}")
+    print(f"{'操作':<8} {'回数':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)")
+    for action, s in result['latency'].items():
+        if s['count']: print(f"{action:<8} {s['count']:>6} {s['p50_ms']:>9.0f} {s['p95_ms']:>9.0f} {s['p99_ms']:>9.0f} {s['max_ms']:>9.0f}")
+    print(f"サーバーの RSS: 開始 {result['rss_start_mb']:.0f} MB / 最大 {result['rss_peak_mb']:.0f} MB / 終了 {result['rss_end_mb']:.0f} MB")
+    print(f"1セッションあたりの受信量: {result['received_mb_per_session']:.2f} MB (WebSocket) + {result['audio_mb_per_session']:.2f} MB (音声ファイル)")
+    print(f"同時に合成中だった数の最大: {result['peak_concurrent_synth']} (合成要求 {result['tts_requests']} 回, 失敗 {result['tts_errors']} 回)")
+    for error in result['errors'][:5]: print(f"  エラー: セッション {error['session']}: {error['error']}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f: json.dump(result, f, ensure_ascii=False, indent=1)
+    return 1 if result['errors'] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="複数セッションを同時に動かす負荷試験")
+    sub = parser.add_subparsers(dest="command")
+    server = sub.add_parser("serve", help="(内部用) 偽の読み上げサーバーにつないだ Streamlit サーバーを動かす")
+    server.add_argument("--port", type=int, required=True)
+    server.add_argument("--tts-url", required=True)
+    server.add_argument("--workdir", required=True)
+
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60, help="全セッションが揃ってから動かし続ける時間 (秒)")
+    parser.add_argument("--ramp", type=float, default=10, help="全セッションが揃うまでの時間 (秒)")
+    parser.add_argument("--think", type=float, default=2.0, help="操作の間の考える時間の平均 (秒)")
+    parser.add_argument("--tts-latency", type=float, default=0.3, help="偽の読み上げサーバーが最初の音声を返すまでの時間 (秒)")
+    parser.add_argument("--tts-jitter", type=float, default=0.1)
+    parser.add_argument("--tts-error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120, help="1回の操作を待つ上限 (秒)")
+    parser.add_argument("--port", type=int, default=0, help="Streamlit サーバーのポート (省略時は空いているもの)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-workdir", action="store_true", help="サーバーのログや、この試験で作った音声を残す")
+    parser.add_argument("--output", help="結果をJSONで保存する")
+    args = parser.parse_args()
+    if args.command == "serve": return serve(args)
+    return run_load(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+# 模擬試験: 複数の問題を「問題番号の読み上げ → 問題 → 解答時間の無音」の順に1本の音声にする
+# 1問分ずつのクリップを並行して合成し、できたものから順に再生できるよう、クリップごとにキャッシュへ置く。
+# 全問そろったら、すべてのクリップをつないだ1本の音声も作る。
+import asyncio
+
+from audio_cache import DEFAULT_FORMAT, make_key
+from audio_render import get_audio_bytes, problem_audio_key, render_problem_audio
+from number_words import number_to_words
+from segment_audio import splice
+
+EXAM_FORMAT_SUFFIX = "+exam"
+ANNOUNCE_GAP = 0.8  # 問題番号の読み上げと問題の間 (秒)
+
+
+def announcement(no):
+    return f"Number {number_to_words(no)}."
+
+
+def exam_clip_key(no, nums, voice, answer_gap, assemble=False, fmt=DEFAULT_FORMAT, gaps=None):
+    body_key = problem_audio_key(nums, voice, assemble, fmt, gaps)
+    return make_key(f"{announcement(no)}\n{body_key}\n{ANNOUNCE_GAP}\n{answer_gap}", voice, fmt + EXAM_FORMAT_SUFFIX)
+
+
+def exam_track_key(clip_keys, voice, fmt=DEFAULT_FORMAT):
+    return make_key("\n".join(clip_keys), voice, fmt + EXAM_FORMAT_SUFFIX)
+
+
+# つなぎ合わせはループ (全セッションの合成) を止めないようスレッドプールで行う
+async def _splice(clips, gaps):
+    return await asyncio.get_running_loop().run_in_executor(None, splice, clips, gaps)
+
+
+# 1問分のクリップを用意して (キャッシュのキー, 音声) を返す
+async def render_exam_clip(cache, backend, no, nums, voice, answer_gap, assemble=False, gaps=None, concurrency=8,
+                           fmt=DEFAULT_FORMAT, cancel_event=None):
+    key = exam_clip_key(no, nums, voice, answer_gap, assemble, fmt, gaps)
+    clip = await cache.aget(key)
+    if clip is not None: return key, clip
+    intro, (_, body) = await asyncio.gather(
+        get_audio_bytes(cache, backend, announcement(no), voice, fmt, cancel_event),
+        render_problem_audio(cache, backend, nums, voice, assemble, gaps, concurrency, fmt, cancel_event))
+    if intro is None or body is None: return key, None  # 中断された
+    clip = await _splice([intro, body], [ANNOUNCE_GAP, answer_gap])
+    await cache.aput(key, clip)
+    return key, clip
+
+
+# problems は [(問題番号, [int, ...]), ...] (この順に読み上げる)
+# 同時に limit 問まで合成し、全問そろったらつないだ1本の音声のキーを返す (中断されたら None)
+async def render_exam(cache, backend, problems, voice, answer_gap, assemble=False, gaps=None, concurrency=8,
+                      fmt=DEFAULT_FORMAT, cancel_event=None, limit=8):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def clip(no, nums):
+        async with semaphore:
+            return await render_exam_clip(cache, backend, no, nums, voice, answer_gap, assemble, gaps, concurrency, fmt, cancel_event)
+
+    results = await asyncio.gather(*(clip(no, nums) for no, nums in problems))
+    if any(data is None for _, data in results): return None
+    key = exam_track_key([k for k, _ in results], voice, fmt)
+    if not await cache.acontains(key):
+        await cache.aput(key, await _splice([data for _, data in results], [0] * len(results)))
+    return key
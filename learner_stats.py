@@ -0,0 +1,234 @@
+# 答え合わせの記録と集計
+# 1回の答え合わせを固定長 (36バイト) のレコードとして、日ごとのファイル (attempts-YYYYMMDD.bin) に追記していく。
+# 集計 (回数・正解数・解答時間の合計) は日ごと × 切り口 (桁数・口数・引き算・声・速さ) ごとと、全期間の合計を持ち、
+# ファイルの読んだところ (オフセット) から先の新しいレコードだけを足し込むので、1回あたり O(1) で更新できる。
+# 他のプロセスが追記した分も、次の refresh() でそのまま取り込まれる。
+# 集計とオフセットはときどき aggregates.json に書き出し、次の起動ではそこから続きだけを読む。
+#
+#   stats = LearnerStats("learner_stats")
+#   stats.record(session=..., q_no=12, nums=[...], voice="en-US-JennyNeural", speed=1.0, correct=True, seconds=8.2)
+#   stats.query("digits")                      # 全期間の桁数ごとの正答率・平均解答時間
+#   python learner_stats.py --by digits voice --since 2026-10-01
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+from atomic_file import write_atomic
+from voices import VOICE_IDS
+
+# 時刻, セッション, 問題番号, 解答時間 (ミリ秒), 声 (crc32), 最小桁数, 最大桁数, 口数, 引き算, 速さ (x10), 正解, 何回目の解答, 出題元
+RECORD = struct.Struct("<dQIII8B")
+FILE_PREFIX, FILE_SUFFIX = "attempts-", ".bin"
+SNAPSHOT = "aggregates.json"
+DIMENSIONS = ("digits", "rows", "subtraction", "voice", "speed")
+MODES = ("csv", "random")
+_VOICE_BY_CODE = {zlib.crc32(v.encode()): v for v in VOICE_IDS}
+
+
+def voice_code(voice):
+    return zlib.crc32(voice.encode())
+
+
+def day_of(ts):
+    return time.strftime("%Y%m%d", time.localtime(ts))
+
+
+def _file_day(name):
+    return name[len(FILE_PREFIX):-len(FILE_SUFFIX)]
+
+
+def _parse_day(text):
+    # 2026-10-01 / 20261001 のどちらでも
+    return text.replace("-", "") if text else None
+
+
+# 1レコード -> 集計の切り口ごとの値
+def _dimension_values(fields):
+    _, _, _, _, voice, min_digits, max_digits, rows, subtraction, speed, _, _, _ = fields
+    return (("all", "all"),
+            ("digits", f"{min_digits}-{max_digits}"),
+            ("rows", str(rows)),
+            ("subtraction", "yes" if subtraction else "no"),
+            ("voice", _VOICE_BY_CODE.get(voice, f"#{voice:08x}")),
+            ("speed", f"{speed / 10:.1f}"))
+
+
+class LearnerStats:
+    def __init__(self, stats_dir, snapshot_interval=60.0, first_only=True):
+        self.stats_dir = stats_dir
+        self.snapshot_interval = snapshot_interval
+        self.first_only = first_only  # 同じ問題の2回目以降の解答は記録だけして集計しない
+        self._lock = threading.Lock()
+        self._days = {}     # 日 -> {切り口: {値: [回数, 正解数, 解答時間の合計 (ミリ秒), 時間を測れた回数]}}
+        self._totals = {}   # 全期間の合計 (形は日ごとのものと同じ)
+        self._offsets = {}  # ファイル名 -> 集計済みのバイト数
+        self.records = 0
+        self._saved_at = time.monotonic()
+        os.makedirs(stats_dir, exist_ok=True)
+        self._load_snapshot()
+        self.refresh()
+
+    # --- 記録 ---
+    def record(self, session, q_no, nums, voice, speed, correct, seconds=None, attempt=1, mode="csv", ts=None):
+        ts = time.time() if ts is None else ts
+        digits = [len(str(abs(n))) for n in nums]
+        data = RECORD.pack(
+            ts, int(session, 16) & (2**64 - 1) if isinstance(session, str) else session, q_no,
+            int(seconds * 1000) if seconds is not None else 0, voice_code(voice),
+            min(digits), max(digits), len(nums), min(nums) < 0, round(speed * 10), bool(correct),
+            min(attempt, 255), MODES.index(mode) if mode in MODES else 0)
+        path = os.path.join(self.stats_dir, f"{FILE_PREFIX}{day_of(ts)}{FILE_SUFFIX}")
+        # 1レコードを1回の write で追記する (O_APPEND なので、同時に書く他のプロセスと混ざらない)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try: os.write(fd, data)
+        finally: os.close(fd)
+        self.refresh([os.path.basename(path)])
+
+    # --- 集計の更新 (前回から増えた分だけ読む。names を渡せばそのファイルだけ見る) ---
+    def refresh(self, names=None):
+        with self._lock:
+            try:
+                if names is None:
+                    entries = [(e.name, e.stat().st_size) for e in os.scandir(self.stats_dir)
+                               if e.name.startswith(FILE_PREFIX) and e.name.endswith(FILE_SUFFIX)]
+                else: entries = [(name, os.path.getsize(os.path.join(self.stats_dir, name))) for name in names]
+            except OSError: return
+            for name, size in entries:
+                offset = self._offsets.get(name, 0)
+                count = (size - offset) // RECORD.size  # 書きかけの端数は次回に回す
+                if count <= 0: continue
+                with open(os.path.join(self.stats_dir, name), 'rb') as f:
+                    f.seek(offset)
+                    data = f.read(count * RECORD.size)
+                # 読んだ分をいったん集計してから、その日の集計と全期間の合計に足す
+                batch = {}
+                for fields in RECORD.iter_unpack(data): self._add(batch, fields)
+                day = self._days.setdefault(_file_day(name), {})
+                _merge(day, batch)
+                _merge(self._totals, batch)
+                self._offsets[name] = offset + len(data)
+            save = time.monotonic() - self._saved_at >= self.snapshot_interval
+        if save:
+            try: self.save_snapshot()
+            except OSError: pass  # 集計は手元にあるので、保存できなくても次の起動でログから数え直すだけ
+
+    def _add(self, aggs, fields):
+        self.records += 1
+        if self.first_only and fields[11] > 1: return
+        response_ms, correct = fields[3], fields[10]
+        for dimension, value in _dimension_values(fields):
+            values = aggs.get(dimension)
+            if values is None: values = aggs[dimension] = {}
+            agg = values.get(value)
+            if agg is None: agg = values[value] = [0, 0, 0, 0]
+            agg[0] += 1
+            agg[1] += correct
+            if response_ms:
+                agg[2] += response_ms
+                agg[3] += 1
+
+    # --- 問い合わせ ---
+    # 切り口ごとの集計 (since / until は 2026-10-01 または 20261001 の形。どちらも含む)
+    def query(self, dimension, since=None, until=None):
+        since, until = _parse_day(since), _parse_day(until)
+        with self._lock:
+            if not since and not until:
+                totals = {value: list(agg) for value, agg in self._totals.get(dimension, {}).items()}
+            else:
+                totals = {}
+                for day, aggs in self._days.items():
+                    if since and day < since or until and day > until: continue
+                    for value, agg in aggs.get(dimension, {}).items():
+                        total = totals.setdefault(value, [0, 0, 0, 0])
+                        for i, n in enumerate(agg): total[i] += n
+        return [{'value': value, 'attempts': n, 'correct': correct, 'accuracy': correct / n if n else 0.0,
+                 'mean_seconds': time_ms / timed / 1000 if timed else None}
+                for value, (n, correct, time_ms, timed) in sorted(totals.items(), key=lambda item: _sort_key(item[0]))]
+
+    def days(self):
+        with self._lock: return sorted(self._days)
+
+    # 1日分のレコードをそのまま読む (集計にない切り口で調べたいとき用)
+    def read_day(self, day):
+        path = os.path.join(self.stats_dir, f"{FILE_PREFIX}{_parse_day(day)}{FILE_SUFFIX}")
+        try:
+            with open(path, 'rb') as f: data = f.read()
+        except OSError: return []
+        return list(RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]))
+
+    def stats(self):
+        with self._lock:
+            return {'records': self.records, 'days': len(self._days), 'bytes': sum(self._offsets.values())}
+
+    # --- 集計の保存・読み込み ---
+    def save_snapshot(self):
+        with self._lock:
+            state = {'version': 2, 'record_size': RECORD.size, 'first_only': self.first_only, 'offsets': dict(self._offsets),
+                     'records': self.records,
+                     'days': self._days}
+            text = json.dumps(state, separators=(",", ":"))
+            self._saved_at = time.monotonic()
+        write_atomic(os.path.join(self.stats_dir, SNAPSHOT), text)
+
+    def _load_snapshot(self):
+        try:
+            with open(os.path.join(self.stats_dir, SNAPSHOT), encoding='utf-8') as f: state = json.load(f)
+        except (OSError, ValueError): return
+        # 形式や集計のしかたが違えば使わず、ログから集計し直す
+        if state.get('version') != 2 or state.get('record_size') != RECORD.size or state.get('first_only') != self.first_only: return
+        self._offsets = state['offsets']
+        self.records = state['records']
+        self._days = state['days']
+        for aggs in self._days.values(): _merge(self._totals, aggs)
+
+
+def _merge(into, aggs):
+    for dimension, values in aggs.items():
+        target = into.setdefault(dimension, {})
+        for value, agg in values.items():
+            total = target.get(value)
+            if total is None: target[value] = list(agg)
+            else:
+                for i, n in enumerate(agg): total[i] += n
+
+
+def _sort_key(value):
+    head = value.split("-")[0]
+    try: return (0, float(head), value)
+    except ValueError: return (1, 0.0, value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="答え合わせの記録を集計して表示する")
+    parser.add_argument("--dir", default="learner_stats", help="記録のディレクトリ (Webアプリの STATS_DIR)")
+    parser.add_argument("--by", nargs="+", choices=DIMENSIONS, default=list(DIMENSIONS))
+    parser.add_argument("--since", help="この日から (2026-10-01)")
+    parser.add_argument("--until", help="この日まで")
+    args = parser.parse_args()
+    if not os.path.isdir(args.dir): parser.error(f"記録がありません: {args.dir}")
+
+    started = time.perf_counter()
+    stats = LearnerStats(args.dir)
+    loaded = time.perf_counter() - started
+    overall = stats.query("all", args.since, args.until)
+    if not overall:
+        print("該当する記録がありません")
+        return 0
+    total = overall[0]
+    print(f"{total['attempts']:,} 回 / 正答率 {total['accuracy']:.1%}  (記録 {stats.records:,} 件, {len(stats.days())} 日分, 読み込み {loaded * 1000:.0f} ms)")
+    for dimension in args.by:
+        print(f"\n[{dimension}]")
+        print(f"  {'':<24} {'回数':>8} {'正答率':>7} {'平均時間':>8}")
+        for row in stats.query(dimension, args.since, args.until):
+            mean = f"{row['mean_seconds']:.1f}s" if row['mean_seconds'] is not None else "-"
+            print(f"  {row['value']:<24} {row['attempts']:>8,} {row['accuracy']:>7.1%} {mean:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
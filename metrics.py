@@ -0,0 +1,162 @@
+# 処理時間などの計測 (プロセス内で集計し、Prometheus のテキスト形式や JSON Lines で書き出す)
+# ヒストグラムは固定のバケットに数えるだけなので、記録が増えてもメモリは一定。
+# p50/p95/p99 はバケットからの推定値 (Prometheus の histogram_quantile と同じ線形補間)。
+#
+#   from metrics import REGISTRY
+#   with REGISTRY.timer("stage_seconds", stage="tts_total"): ...
+#   REGISTRY.inc("tts_retries_total")
+#   REGISTRY.register("tts_in_flight", lambda: backend.in_flight)
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from atomic_file import write_atomic
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(1024 * 2**i for i in range(14))  # 1KiB〜8MiB
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最後は +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        if not self.count: return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets): return self.buckets[-1]  # +Inf に入ったものは最大のバケットで頭打ち
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class Timer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+
+def _labels_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs: return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def _bucket_bounds(buckets):
+    return [repr(float(b)) for b in buckets] + ["+Inf"]
+
+
+class Metrics:
+    def __init__(self, prefix="yomiage_"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms = {}  # (名前, ラベル) -> Histogram
+        self._counters = {}    # (名前, ラベル) -> 値
+        self._gauges = {}      # 名前 -> 値を返す関数 (dict を返せば名前_キー ごとの値)
+        self._written_at = {}
+
+    # --- 記録 ---
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None: histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        timer = Timer()
+        try: yield timer
+        finally:
+            timer.elapsed = time.perf_counter() - timer.started
+            self.observe(name, timer.elapsed, **labels)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def register(self, name, fn):
+        with self._lock:
+            self._gauges[name] = fn
+
+    # --- 読み出し ---
+    def gauges(self):
+        values = {}
+        with self._lock:
+            gauges = list(self._gauges.items())
+        for name, fn in gauges:
+            try: value = fn()
+            except Exception: continue
+            if isinstance(value, dict): values.update((f"{name}_{k}", v) for k, v in value.items())
+            else: values[name] = value
+        return values
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {
+                (name, labels): {'count': h.count, 'sum': h.sum, **{f"p{int(q * 100)}": h.quantile(q) for q in QUANTILES}}
+                for (name, labels), h in self._histograms.items()}
+            counters = dict(self._counters)
+        return {'histograms': histograms, 'counters': counters, 'gauges': self.gauges()}
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        typed = set()
+        for (name, labels), h in histograms:
+            full = self.prefix + name
+            if full not in typed: lines.append(f"# TYPE {full} histogram"); typed.add(full)
+            cumulative = 0
+            for bound, n in zip(_bucket_bounds(h.buckets), h.counts):
+                cumulative += n
+                lines.append(f"{full}_bucket{_labels_text(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{full}_sum{_labels_text(labels)} {h.sum}")
+            lines.append(f"{full}_count{_labels_text(labels)} {h.count}")
+        for (name, labels), value in counters:
+            full = self.prefix + name
+            if full not in typed: lines.append(f"# TYPE {full} counter"); typed.add(full)
+            lines.append(f"{full}{_labels_text(labels)} {value}")
+        for name, value in sorted(self.gauges().items()):
+            lines.append(f"# TYPE {self.prefix + name} gauge")
+            lines.append(f"{self.prefix + name} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    # --- 書き出し ---
+    # Prometheus の textfile collector や静的配信でそのまま読めるよう、置き換えで書く (min_interval 秒に1回まで)
+    def write_textfile(self, path, min_interval=5.0):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._written_at.get(path, -min_interval) < min_interval: return False
+            self._written_at[path] = now
+        try: write_atomic(path, self.prometheus_text())
+        except OSError: return False
+        return True
+
+
+# 1行1イベントの JSON Lines (後から集計できるよう、計測値をそのまま残す)
+def log_event(path, **fields):
+    line = json.dumps({'ts': time.time(), **fields}, ensure_ascii=False)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(line + "\n")
+
+
+REGISTRY = Metrics()
@@ -0,0 +1,52 @@
+# 整数を英語の読みに変換する (num2words(abs(n), lang='en') からカンマと "and" を除いたものと同じ出力)
+# 0〜999 の読みと桁の単位をあらかじめ表にしておき、3桁ずつ引くだけで組み立てる。
+from functools import lru_cache
+
+_ONES = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine",
+         "ten", "eleven", "twelve", "thirteen", "fourteen", "fifteen", "sixteen",
+         "seventeen", "eighteen", "nineteen"]
+_TENS = ["", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety"]
+SCALES = ["", "thousand", "million", "billion", "trillion", "quadrillion", "quintillion",
+          "sextillion", "septillion", "octillion", "nonillion", "decillion"]
+LIMIT = 1000 ** len(SCALES)  # これ以上は num2words に任せる
+
+
+def _below_1000(n):
+    hundreds, rest = divmod(n, 100)
+    words = []
+    if hundreds: words.append(f"{_ONES[hundreds]} hundred")
+    if rest >= 20: words.append(_TENS[rest // 10] + (f"-{_ONES[rest % 10]}" if rest % 10 else ""))
+    elif rest or not hundreds: words.append(_ONES[rest])
+    return " ".join(words)
+
+
+# _GROUP_WORDS[scale][n] = "n の読み + 単位"  (例: [2][978] = "nine hundred seventy-eight million")
+_BELOW_1000 = [_below_1000(n) for n in range(1000)]
+_GROUP_WORDS = [_BELOW_1000] + [[f"{words} {scale}" for words in _BELOW_1000] for scale in SCALES[1:]]
+
+
+@lru_cache(maxsize=65536)
+def number_to_words(num):
+    n = abs(num)
+    if n < 1000: return _BELOW_1000[n]
+    if n >= LIMIT:
+        from num2words import num2words
+        return num2words(n, lang='en').replace(",", "").replace(" and ", " ")
+    parts = []
+    scale = 0
+    while n:
+        n, group = divmod(n, 1000)
+        if group: parts.append(_GROUP_WORDS[scale][group])
+        scale += 1
+    parts.reverse()
+    return " ".join(parts)
+
+
+# まとめて変換: 1問分 [int, ...] -> [str, ...]
+def numbers_to_words(nums):
+    return [number_to_words(n) for n in nums]
+
+
+# CSV 1ファイル分 {no: [int, ...]} -> {no: [str, ...]}
+def problems_to_words(problems):
+    return {no: numbers_to_words(nums) for no, nums in problems.items()}
@@ -0,0 +1,121 @@
+# 問題セットの音声をまとめて事前生成し、Webアプリと同じ音声キャッシュ (static/audio/) に書き込む
+# すでにある音声は飛ばすので、途中で止めても同じコマンドでそのまま再開できる。
+#
+#   python prerender.py data/*.csv --voices all
+#   python prerender.py data/2018.csv --voices en-US-JennyNeural en-GB-RyanNeural --concurrency 16
+#   python prerender.py --generate 10000 --seed 1 --rows 5 --segments --voices en-US-JennyNeural
+#   python prerender.py data/*.csv --backend fake --cache-dir /tmp/audio   (オフラインでの動作確認)
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from audio_cache import AudioCache, DEFAULT_DISK_BUDGET, DEFAULT_FORMAT
+from audio_render import problem_audio_key, render_problem_audio
+from problem_catalog import parse_problem_csv
+from problem_generator import batch_to_problems, generate_problems
+from segment_audio import DEFAULT_GAPS
+from tts_backend import BACKENDS, ResilientBackend, create_backend
+from voices import VOICE_IDS
+
+# Webアプリと同じく、スクリプトの隣の static/audio/ (どこから実行しても同じ場所)
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "audio")
+
+
+def load_jobs(args):
+    problem_sets = []
+    for pattern in args.csv:
+        paths = sorted(glob.glob(pattern)) or [pattern]
+        for path in paths:
+            problem_sets.append((os.path.basename(path), parse_problem_csv(path)))
+    if args.generate:
+        batch = generate_problems(args.generate, args.min_digit, args.max_digit, args.rows, args.subtraction, args.seed)
+        problem_sets.append(("generated", batch_to_problems(batch)))
+    voices = VOICE_IDS if args.voices == ["all"] else args.voices
+    return [(name, no, problems[no], voice) for name, problems in problem_sets for no in problems for voice in voices]
+
+
+async def prerender(jobs, cache, backend, concurrency, assemble=False, executor=None, fmt=DEFAULT_FORMAT, report_every=100, gaps=None):
+    stats = {'rendered': 0, 'skipped': 0, 'failed': 0}
+    pending = iter(jobs)
+    started = time.monotonic()
+
+    async def worker():
+        for name, no, nums, voice in pending:
+            if await cache.acontains(problem_audio_key(nums, voice, assemble, fmt, gaps)):
+                stats['skipped'] += 1
+                continue
+            try:
+                await render_problem_audio(cache, backend, nums, voice, assemble, gaps, concurrency, fmt, executor=executor)
+                stats['rendered'] += 1
+            except Exception as e:
+                stats['failed'] += 1
+                print(f"失敗: {name} #{no} ({voice}): {e}", file=sys.stderr)
+            done = stats['rendered'] + stats['failed']
+            if report_every and done % report_every == 0:
+                print(f"  {done + stats['skipped']}/{len(jobs)} ({time.monotonic() - started:.1f}s)", flush=True)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="問題セットの音声を事前生成する")
+    parser.add_argument("csv", nargs="*", help="問題CSV (data/*.csv のようなパターンも可)")
+    parser.add_argument("--voices", nargs="+", default=["all"], help="声のID (all ですべての声)")
+    parser.add_argument("--segments", action="store_true", help="ランダム生成モードと同じく、フレーズ単位の音声をつなぎ合わせて作る")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に合成する数 (全体での上限)")
+    parser.add_argument("--gap", action="append", default=[], metavar="KIND=SECONDS",
+                        help=f"フレーズ間の無音 (--segments のとき。Webアプリの SEGMENT_GAPS と合わせる。既定 {DEFAULT_GAPS})")
+    parser.add_argument("--workers", type=int, default=0, help="つなぎ合わせ (--segments) を行うプロセス数")
+    parser.add_argument("--timeout", type=float, default=30.0, help="1回の合成の上限 (秒)")
+    parser.add_argument("--retries", type=int, default=2, help="合成に失敗したときの再試行回数")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="edge")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="--backend fake のときの1回あたりの待ち時間 (秒)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--disk-budget", type=int, default=DEFAULT_DISK_BUDGET, help="保存領域の上限 (バイト)。Webアプリと同じ値 (audio_cache.DEFAULT_DISK_BUDGET) が既定")
+    gen = parser.add_argument_group("問題をその場で生成する")
+    gen.add_argument("--generate", type=int, default=0, metavar="COUNT")
+    gen.add_argument("--min-digit", type=int, default=7)
+    gen.add_argument("--max-digit", type=int, default=14)
+    gen.add_argument("--rows", type=int, default=5)
+    gen.add_argument("--subtraction", action="store_true")
+    gen.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    if not args.csv and not args.generate: parser.error("問題CSVか --generate を指定してください")
+    unknown = [v for v in args.voices if v != "all" and v not in VOICE_IDS]
+    if unknown: parser.error(f"未知の声です: {', '.join(unknown)}")
+
+    if args.disk_budget > DEFAULT_DISK_BUDGET and os.path.abspath(args.cache_dir) == os.path.abspath(DEFAULT_CACHE_DIR):
+        print(f"警告: --disk-budget ({args.disk_budget:,}) が Webアプリの上限 ({DEFAULT_DISK_BUDGET:,}) より大きいので、"
+              "Webアプリが次に音声を保存したときに上限を超えた分が追い出されます", file=sys.stderr)
+
+    try: gaps = {kind: float(seconds) for kind, seconds in (item.split("=", 1) for item in args.gap)}
+    except ValueError: parser.error("--gap は KIND=SECONDS の形で指定してください")
+    unknown = [kind for kind in gaps if kind not in DEFAULT_GAPS]
+    if unknown: parser.error(f"未知の無音の種類です: {', '.join(unknown)}")
+
+    jobs = load_jobs(args)
+    cache = AudioCache(args.cache_dir, mem_budget=16 * 1024**2, disk_budget=args.disk_budget)
+    options = {'latency': args.fake_latency} if args.backend == "fake" else {}
+    executor = ProcessPoolExecutor(args.workers) if args.workers and args.segments else None
+
+    async def run():
+        backend = ResilientBackend(create_backend(args.backend, **options), args.concurrency, args.timeout, args.retries)
+        return await prerender(jobs, cache, backend, args.concurrency, args.segments, executor, gaps=gaps)
+
+    print(f"{len(jobs)} 件 (声 {len({job[3] for job in jobs})} 種類) を {args.cache_dir} に生成します")
+    started = time.monotonic()
+    try: stats = asyncio.run(run())
+    finally:
+        if executor: executor.shutdown()
+    print(f"完了: 生成 {stats['rendered']} / スキップ {stats['skipped']} / 失敗 {stats['failed']} "
+          f"({time.monotonic() - started:.1f}s)")
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
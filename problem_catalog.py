@@ -0,0 +1,301 @@
+# 問題CSVの一覧と中身を一度だけ読み込んで保持する（ファイルの更新日時とサイズが変わったら読み直す）
+# 1ファイル分の問題は ProblemSet として「問題番号 / 区切り位置 / 数値」の int64 配列にまとめて持つ。
+# 大きなCSVは LazyProblemSet として行の位置だけを索引にし、問題は必要なときに1行ずつ読む。
+import csv
+import hashlib
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+from atomic_file import write_atomic
+
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+_ROW_COLUMN = re.compile(r"row(\d+)$")
+
+
+def _digits(n):
+    return len(str(abs(n)))
+
+
+# 1問分の (最小桁数, 最大桁数, 引き算の有無)
+def _row_info(nums):
+    if not nums: return 0, 0, False
+    magnitudes = [abs(n) for n in nums]
+    return _digits(min(magnitudes)), _digits(max(magnitudes)), min(nums) < 0
+
+
+# ヘッダ行から「no」列と row1, row2, ... 列の位置を一度だけ調べておく
+def _parse_header(header):
+    if 'no' not in header: return None, []
+    row_cols = []
+    for idx, name in enumerate(header):
+        m = _ROW_COLUMN.match(name)
+        if m: row_cols.append((int(m.group(1)), idx))
+    return header.index('no'), [idx for _, idx in sorted(row_cols)]
+
+
+def _parse_row(row, no_idx, row_cols):
+    return int(row[no_idx]), [int(row[idx]) for idx in row_cols if idx < len(row) and row[idx]]
+
+
+class _IndexedProblems(Mapping):
+    # 子クラスは numbers / min_digits / max_digits / negative と _row(i) を用意する
+    # dict と同じように problems[no] / no in problems で使える
+
+    def _position(self, no):
+        i = bisect_left(self.numbers, no)
+        if i < len(self.numbers) and self.numbers[i] == no: return i
+        return None
+
+    def __getitem__(self, no):
+        i = self._position(no)
+        if i is None: raise KeyError(no)
+        return self._row(i)
+
+    def __contains__(self, no):
+        return self._position(no) is not None
+
+    def __iter__(self):
+        return iter(self.numbers)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    # --- 読み直さずに答えられる情報 ---
+    @property
+    def min_no(self):
+        return self.numbers[0] if len(self.numbers) else None
+
+    @property
+    def max_no(self):
+        return self.numbers[-1] if len(self.numbers) else None
+
+    def digit_range(self, no):
+        i = self._position(no)
+        return self.min_digits[i], self.max_digits[i]
+
+    def has_subtraction(self, no):
+        return bool(self.negative[self._position(no)])
+
+    def summary(self):
+        if not len(self.numbers): return {'count': 0, 'min_digits': 0, 'max_digits': 0, 'has_subtraction': False}
+        return {
+            'count': len(self.numbers),
+            'min_digits': min(self.min_digits),
+            'max_digits': max(self.max_digits),
+            'has_subtraction': any(self.negative),
+        }
+
+
+class ProblemSet(_IndexedProblems):
+    # numbers[i] 番の問題は values[offsets[i]:offsets[i + 1]]
+    # int64 に収まらない数値を含む場合だけ values を Python の int のリストで持つ
+    def __init__(self, numbers, offsets, values):
+        self.numbers = numbers
+        self.offsets = offsets
+        self.values = values
+        self.min_digits = array('B')
+        self.max_digits = array('B')
+        self.negative = array('B')
+        for i in range(len(numbers)):
+            min_digit, max_digit, negative = _row_info(values[offsets[i]:offsets[i + 1]])
+            self.min_digits.append(min_digit); self.max_digits.append(max_digit); self.negative.append(negative)
+
+    @classmethod
+    def from_dict(cls, problems):
+        numbers, offsets, values = array('q'), array('q', [0]), []
+        for no in sorted(problems):
+            numbers.append(no)
+            values.extend(problems[no])
+            offsets.append(len(values))
+        if all(INT64_MIN <= v <= INT64_MAX for v in values): values = array('q', values)
+        return cls(numbers, offsets, values)
+
+    def _row(self, i):
+        return list(self.values[self.offsets[i]:self.offsets[i + 1]])
+
+
+EMPTY = ProblemSet.from_dict({})
+
+
+def parse_problem_csv(path):
+    problems = {}
+    with open(path, mode='r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        no_idx, row_cols = _parse_header(next(reader, None) or [])
+        if no_idx is None: return EMPTY
+        for row in reader:
+            try:
+                no, nums = _parse_row(row, no_idx, row_cols)
+                problems[no] = nums
+            except (ValueError, IndexError): continue
+    return ProblemSet.from_dict(problems)
+
+
+# --- 大きなCSV用: 行位置の索引ファイル (index_dir に置く) ---
+# ヘッダ: マジック, CSVの mtime_ns, CSVのサイズ, 問題数
+# 本体: 問題番号 q[n], 行の先頭位置 q[n], 最小桁数 B[n], 最大桁数 B[n], 引き算の有無 B[n]
+_INDEX_MAGIC = b"YPIDX01\0"
+_INDEX_HEADER = struct.Struct("<8sqqq")
+
+
+def _decode_line(line):
+    return line.decode('utf-8-sig').rstrip("\r\n")
+
+
+def _split_line(line):
+    # 引用符のない行 (ふつうの問題CSV) は csv モジュールを通さずに分割する
+    if b'"' not in line: return _decode_line(line).split(",")
+    return next(csv.reader([_decode_line(line)]), [])
+
+
+class LazyProblemSet(_IndexedProblems):
+    # 問題は問い合わせのたびにCSVの該当行だけを読むので、問題数が増えてもメモリはほぼ一定
+    # use_mmap=True なら索引とCSVをメモリマップして読む
+    def __init__(self, path, index_dir, signature=None, use_mmap=False):
+        self.path = path
+        self.use_mmap = use_mmap
+        self._lock = threading.Lock()
+        if signature is None:
+            info = os.stat(path); signature = (info.st_mtime_ns, info.st_size)
+        self.signature = signature
+        self.index_path = os.path.join(index_dir, self._index_name(path))
+        with open(path, 'rb') as f:
+            self._no_idx, self._row_cols = _parse_header(_split_line(f.readline()))
+        if self._no_idx is None or not self._load_index():
+            self._build_index()
+            self._load_index()
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap and signature[1] else None
+
+    @staticmethod
+    def _index_name(path):
+        digest = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:12]
+        return f"{os.path.basename(path)}.{digest}.idx"
+
+    def _load_index(self):
+        try: f = open(self.index_path, 'rb')
+        except OSError: return False
+        with f:
+            head = f.read(_INDEX_HEADER.size)
+            if len(head) < _INDEX_HEADER.size: return False
+            magic, mtime_ns, size, count = _INDEX_HEADER.unpack(head)
+            if magic != _INDEX_MAGIC or (mtime_ns, size) != self.signature: return False
+            expected = _INDEX_HEADER.size + count * (8 + 8 + 3)
+            if os.fstat(f.fileno()).st_size != expected: return False
+            if self.use_mmap and count:
+                buf = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                f.seek(0); buf = memoryview(f.read())
+        pos = _INDEX_HEADER.size
+        self.numbers = buf[pos:pos + 8 * count].cast('q'); pos += 8 * count
+        self.line_offsets = buf[pos:pos + 8 * count].cast('q'); pos += 8 * count
+        self.min_digits = buf[pos:pos + count]; pos += count
+        self.max_digits = buf[pos:pos + count]; pos += count
+        self.negative = buf[pos:pos + count]
+        return True
+
+    def _build_index(self):
+        rows = {}
+        if self._no_idx is not None:
+            with open(self.path, 'rb') as f:
+                offset = len(f.readline())
+                for line in f:
+                    try:
+                        no, nums = _parse_row(_split_line(line), self._no_idx, self._row_cols)
+                        rows[no] = (offset, *_row_info(nums))
+                    except (ValueError, IndexError): pass
+                    offset += len(line)
+        order = sorted(rows)
+        body = [
+            array('q', order).tobytes(),
+            array('q', [rows[no][0] for no in order]).tobytes(),
+            bytes(rows[no][1] for no in order),
+            bytes(rows[no][2] for no in order),
+            bytes(rows[no][3] for no in order),
+        ]
+        write_atomic(self.index_path, [_INDEX_HEADER.pack(_INDEX_MAGIC, *self.signature, len(order)), *body])
+
+    def _read_line(self, offset):
+        if self._data is not None:
+            end = self._data.find(b"\n", offset)
+            return self._data[offset:end if end >= 0 else len(self._data)]
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.readline()
+
+    def _row(self, i):
+        return _parse_row(_split_line(self._read_line(self.line_offsets[i])), self._no_idx, self._row_cols)[1]
+
+
+class ProblemCatalog:
+    # min_interval 秒以内の再確認はしないので、再実行ごとのコストはファイル数によらない
+    # lazy_threshold バイト以上のCSVは LazyProblemSet として索引だけを持つ
+    def __init__(self, data_dir, min_interval=2.0, lazy_threshold=1024 * 1024, index_dir=".problem_index", use_mmap=False):
+        self.data_dir = data_dir
+        self.min_interval = min_interval
+        self.lazy_threshold = lazy_threshold
+        self.index_dir = index_dir
+        self.use_mmap = use_mmap
+        self._lock = threading.Lock()
+        self._entries = {}  # ファイル名 -> ((mtime_ns, size), ProblemSet)
+        self._names = []
+        self._checked_at = None
+
+    def _signature(self, name):
+        try: info = os.stat(os.path.join(self.data_dir, name))
+        except OSError: return None
+        return info.st_mtime_ns, info.st_size
+
+    def _load(self, name, signature):
+        entry = self._entries.get(name)
+        if entry and entry[0] == signature: return entry[1]
+        path = os.path.join(self.data_dir, name)
+        try:
+            if signature[1] >= self.lazy_threshold:
+                problem_set = LazyProblemSet(path, self.index_dir, signature, self.use_mmap)
+            else:
+                problem_set = parse_problem_csv(path)
+        except (OSError, UnicodeDecodeError, csv.Error): problem_set = EMPTY
+        self._entries[name] = (signature, problem_set)
+        return problem_set
+
+    def refresh(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._checked_at is not None and now - self._checked_at < self.min_interval: return
+            self._checked_at = now
+            try: names = sorted(f for f in os.listdir(self.data_dir) if f.endswith(".csv"))
+            except OSError: names = []
+            for name in set(self._entries) - set(names): del self._entries[name]
+            for name in names:
+                signature = self._signature(name)
+                if signature is not None: self._load(name, signature)
+            self._names = [name for name in names if name in self._entries]
+
+    def names(self):
+        self.refresh()
+        return list(self._names)
+
+    def counts(self):
+        self.refresh()
+        with self._lock:
+            return {name: len(self._entries[name][1]) for name in self._names}
+
+    def summaries(self):
+        self.refresh()
+        with self._lock:
+            return {name: self._entries[name][1].summary() for name in self._names}
+
+    # 選択中のファイルだけは毎回 stat して、書き換えられていれば読み直す
+    def get(self, name):
+        signature = self._signature(name) if name else None
+        if signature is None: return EMPTY
+        with self._lock:
+            return self._load(name, signature)
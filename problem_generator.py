@@ -0,0 +1,234 @@
+# 問題のまとめて生成（Streamlit なしで使える / seed を渡せば同じ問題列を再現できる）
+# 1問ずつ作る problem_from_digits (Webアプリの generate_single_problem) と同じ決まりで作る:
+#   - 桁数は「桁数の山札」から順に配り、1問の中に最小桁数と最大桁数を必ず含める
+#   - 引き算ありなら、途中の行の半分以上を引き算にし、引き算は2行までしか続けない
+#   - 途中の合計がマイナスにならない範囲でだけ引く
+#
+#   python problem_generator.py --count 10000 --min-digit 7 --max-digit 14 --rows 5 --subtraction --seed 1 -o data/practice.csv
+import argparse
+import csv
+import random
+
+INT64_MAX_DIGITS = 17  # 17桁 × 15口でも合計が int64 に収まる。これを超えると Python の int で計算する
+MINUS_RATE = 0.7
+MAX_ATTEMPTS = 100
+
+# numpy は読み込みに時間がかかるので、まとめて生成するときに初めて読み込む
+# (Webアプリの起動や、1問ずつの生成 deal_digits / problem_from_digits では使わない)
+np = None
+_POW10 = None
+
+
+def _load_numpy():
+    global np, _POW10
+    if np is not None: return
+    import numpy
+    _POW10 = numpy.array([10**i for i in range(INT64_MAX_DIGITS + 1)], dtype=numpy.int64)
+    np = numpy
+
+
+def _uniform_big(rng, lo, hi):
+    # int64 に収まらない範囲の一様乱数 (棄却法)
+    span = hi - lo + 1
+    if span <= 2**62: return lo + int(rng.integers(0, span))
+    bits = span.bit_length()
+    size = (bits + 7) // 8
+    while True:
+        r = int.from_bytes(rng.bytes(size), 'little') >> (8 * size - bits)
+        if r < span: return lo + r
+
+
+class ProblemGenerator:
+    def __init__(self, min_digit, max_digit, rows, allow_subtraction, seed=None):
+        if not 1 <= min_digit <= max_digit: raise ValueError("桁数の指定が正しくありません (最小桁数は1以上、最大桁数以下にしてください)")
+        if rows < 1: raise ValueError("口数は1以上にしてください")
+        self.min_digit, self.max_digit = min_digit, max_digit
+        self.rows = rows
+        self.allow_subtraction = allow_subtraction
+        _load_numpy()
+        self.rng = np.random.default_rng(seed)
+        self.deck = np.empty(0, dtype=np.int64)  # 前回配りきれなかった山札の残り
+
+    # --- 桁数 ---
+    def _digits(self, count):
+        digit_range = np.arange(self.min_digit, self.max_digit + 1, dtype=np.int64)
+        need = count * self.rows - len(self.deck)
+        decks = max(0, -(-need // len(digit_range)))
+        shuffled = self.rng.permuted(np.tile(digit_range, (decks, 1)), axis=1).ravel()
+        stream = np.concatenate([self.deck, shuffled])
+        digits, self.deck = stream[:count * self.rows].reshape(count, self.rows), stream[count * self.rows:]
+
+        # 最小桁数・最大桁数が含まれていない問題は、もう一方ではない行をランダムに1つ置き換える
+        for target, keep in ((self.min_digit, self.max_digit), (self.max_digit, self.min_digit)):
+            missing = ~(digits == target).any(axis=1)
+            if not missing.any(): continue
+            scores = self.rng.random((int(missing.sum()), self.rows))
+            scores[digits[missing] == keep] = -1.0
+            digits[np.flatnonzero(missing), scores.argmax(axis=1)] = target
+        return digits
+
+    # --- 引き算の位置 ---
+    def _minus_mask(self, count):
+        mask = np.zeros((count, self.rows), dtype=bool)
+        middle = self.rows - 2
+        if not self.allow_subtraction or middle <= 0: return mask
+        need = (middle + 1) // 2
+        pending = np.arange(count)
+        for _ in range(MAX_ATTEMPTS):
+            if not len(pending): break
+            draws = self.rng.random((len(pending), middle)) < MINUS_RATE
+            pattern = np.zeros_like(draws)
+            consecutive = np.zeros(len(pending), dtype=np.int64)
+            for i in range(middle):
+                pattern[:, i] = draws[:, i] & (consecutive < 2)
+                consecutive = np.where(pattern[:, i], consecutive + 1, 0)
+            ok = pattern.sum(axis=1) >= need
+            mask[pending[ok], 1:self.rows - 1] = pattern[ok]
+            pending = pending[~ok]
+        return mask
+
+    # --- 数値 ---
+    def _values_int64(self, digits, minus):
+        lo, hi = _POW10[digits - 1], _POW10[digits] - 1
+        values = np.empty(digits.shape, dtype=np.int64)
+        total = np.zeros(len(digits), dtype=np.int64)
+        for r in range(self.rows):
+            lo_r, hi_r = lo[:, r], hi[:, r]
+            positive = self.rng.integers(lo_r, hi_r, endpoint=True)
+            limit = np.minimum(hi_r, total)
+            can_minus = minus[:, r] & (lo_r <= limit)
+            negative = self.rng.integers(lo_r, np.where(can_minus, limit, hi_r), endpoint=True)
+            values[:, r] = np.where(can_minus, -negative, positive)
+            total += values[:, r]
+        return values
+
+    def _values_big(self, digits, minus):
+        values = np.empty(digits.shape, dtype=object)
+        for i, (row_digits, row_minus) in enumerate(zip(digits.tolist(), minus.tolist())):
+            total = 0
+            for r, (d, is_minus) in enumerate(zip(row_digits, row_minus)):
+                lo, hi = 10**(d - 1), 10**d - 1
+                limit = min(hi, total)
+                val = -_uniform_big(self.rng, lo, limit) if is_minus and lo <= limit else _uniform_big(self.rng, lo, hi)
+                values[i, r] = val
+                total += val
+        return values
+
+    # count 問分を (count, rows) の配列で返す (17桁までは int64、それ以上は Python の int)
+    def generate(self, count):
+        digits = self._digits(count)
+        minus = self._minus_mask(count)
+        if self.max_digit <= INT64_MAX_DIGITS: return self._values_int64(digits, minus)
+        return self._values_big(digits, minus)
+
+
+# --- 1問ずつ作る (Webアプリのランダム生成用。山札は呼び出し側が持ち回る) ---
+# 山札 deck から rows 枚配って (この問題の桁数, 残りの山札) を返す
+def deal_digits(deck, rows, min_digit, max_digit):
+    if not 1 <= min_digit <= max_digit: raise ValueError("桁数の指定が正しくありません (最小桁数は1以上、最大桁数以下にしてください)")  # 空の山札を配り続けないように
+    if deck and (min(deck) < min_digit or max(deck) > max_digit): deck = []
+    digit_range = list(range(min_digit, max_digit + 1))
+    while len(deck) < rows:
+        new_set = digit_range[:]; random.shuffle(new_set); deck.extend(new_set)
+    current_digits, deck = deck[:rows], deck[rows:]  # 先頭から rows 枚まとめて配る (pop(0) の繰り返しは O(n))
+    if min_digit not in current_digits:
+        target_idx = random.choice([i for i, d in enumerate(current_digits) if d != max_digit] or [0])
+        current_digits[target_idx] = min_digit
+    if max_digit not in current_digits:
+        target_idx = random.choice([i for i, d in enumerate(current_digits) if d != min_digit] or [0])
+        current_digits[target_idx] = max_digit
+    return current_digits, deck
+
+
+# 引き算の生成ロジック
+def problem_from_digits(digits_list, allow_subtraction):
+    rows = len(digits_list)
+    nums = []
+    current_total = 0
+    
+    minus_indices = set()
+    if allow_subtraction and rows > 2:
+        middle_rows_count = rows - 2
+        min_minus_count = (middle_rows_count + 1) // 2
+        
+        for _ in range(100):
+            temp_indices = []
+            consecutive_minus = 0 
+            
+            for i in range(middle_rows_count):
+                row_idx = i + 1 
+                
+                can_be_minus = (consecutive_minus < 2)
+                
+                is_minus = False
+                if can_be_minus:
+                    if random.random() < 0.7:
+                        is_minus = True
+                
+                if is_minus:
+                    temp_indices.append(row_idx)
+                    consecutive_minus += 1
+                else:
+                    consecutive_minus = 0 
+            
+            if len(temp_indices) >= min_minus_count:
+                minus_indices = set(temp_indices)
+                break
+    
+    for r, d in enumerate(digits_list):
+        min_val = 10**(d-1)
+        max_val = 10**d - 1
+        
+        if r in minus_indices:
+            limit = min(max_val, current_total)
+            if min_val <= limit:
+                val = random.randint(min_val, limit)
+                val = -val 
+            else:
+                val = random.randint(min_val, max_val)
+        else:
+            val = random.randint(min_val, max_val)
+        
+        nums.append(val)
+        current_total += val
+        
+    return nums
+
+
+def generate_problems(count, min_digit, max_digit, rows, allow_subtraction, seed=None):
+    return ProblemGenerator(min_digit, max_digit, rows, allow_subtraction, seed).generate(count)
+
+
+# {問題番号: [int, ...]} (CSV読み込みと同じ形)
+def batch_to_problems(batch, start_no=1):
+    return {start_no + i: [int(v) for v in row] for i, row in enumerate(batch.tolist())}
+
+
+def write_problem_csv(path, batch, start_no=1):
+    rows = batch.shape[1]
+    with open(path, mode='w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['no'] + [f'row{i}' for i in range(1, rows + 1)])
+        for i, row in enumerate(batch.tolist()):
+            writer.writerow([start_no + i] + row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="読み上げ算の問題をまとめて生成してCSVに書き出す")
+    parser.add_argument("--count", type=int, required=True)
+    parser.add_argument("--min-digit", type=int, default=7)
+    parser.add_argument("--max-digit", type=int, default=14)
+    parser.add_argument("--rows", type=int, default=5)
+    parser.add_argument("--subtraction", action="store_true")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--start-no", type=int, default=1)
+    parser.add_argument("-o", "--output", required=True)
+    args = parser.parse_args()
+
+    batch = generate_problems(args.count, args.min_digit, args.max_digit, args.rows, args.subtraction, args.seed)
+    write_problem_csv(args.output, batch, args.start_no)
+    print(f"{args.count} 問を {args.output} に書き出しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# フレーズ単位の音声をつなぎ合わせて、問題1問分の音声を組み立てる
+# フレーズごとの合成結果は AudioCache に (フレーズ, 声, 形式) で保存され、
+# 足りないフレーズだけを並行して合成する。MP3 はフレーム単位でそのまま連結できる。
+import asyncio
+
+from audio_cache import DEFAULT_FORMAT, make_key
+
+# 直後に入れる無音の長さ (秒)
+DEFAULT_GAPS = {'prefix': 0.08, 'word': 0.03, ',': 0.3, '.': 0.6, 'end': 0.0}
+
+# --- MP3 フレーム ---
+# (MPEG version bits) -> ビットレート表 (kbps) / サンプリング周波数表 (Hz)  ※Layer III のみ
+_BITRATES = {
+    3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],     # MPEG-2
+    0: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],     # MPEG-2.5
+}
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+# edge-tts 既定の audio-24khz-48kbitrate-mono-mp3 の無音フレーム用ヘッダ
+_DEFAULT_HEADER = bytes([0xFF, 0xF3, 0x64, 0xC4])
+
+
+def _parse_header(data, pos):
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0: return None
+    version = (data[pos + 1] >> 3) & 0x03
+    layer = (data[pos + 1] >> 1) & 0x03
+    bitrate_idx = data[pos + 2] >> 4
+    rate_idx = (data[pos + 2] >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_idx in (0, 15) or rate_idx == 3: return None
+    bitrate = _BITRATES[version][bitrate_idx] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_idx]
+    padding = (data[pos + 2] >> 1) & 0x01
+    mono = (data[pos + 3] >> 6) == 3
+    if version == 3:
+        length, samples, side_info = 144 * bitrate // sample_rate + padding, 1152, 17 if mono else 32
+    else:
+        length, samples, side_info = 72 * bitrate // sample_rate + padding, 576, 9 if mono else 17
+    return length, samples / sample_rate, side_info
+
+
+def _skip_id3(data):
+    if data[:3] != b"ID3" or len(data) < 10: return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    return 10 + size
+
+
+# 音声フレームだけを取り出す (ID3 タグや Xing/Info フレームは連結すると再生時間が狂うので除く)
+def audio_frames(data):
+    pos = _skip_id3(data)
+    frames = []
+    while pos < len(data):
+        header = _parse_header(data, pos)
+        if header is None:
+            pos += 1; continue  # 同期ずれは次の同期ワードまで読み飛ばす
+        length, _, side_info = header
+        frame = data[pos:pos + length]
+        tag = frame[4 + side_info:8 + side_info]
+        if tag not in (b"Xing", b"Info"): frames.append(frame)
+        pos += length
+    return frames
+
+
+# 同じ形式の無音フレームを並べて、指定した長さの無音を作る
+def silence(seconds, like=None):
+    header = like[:4] if like else _DEFAULT_HEADER
+    header = header[:2] + bytes([header[2] & 0xFD]) + header[3:4]  # パディングなし
+    length, duration, _ = _parse_header(header + bytes(4), 0)
+    count = round(seconds / duration)
+    return (header + bytes(length - 4)) * count
+
+
+def splice(clips, gaps):
+    parts = []
+    for clip, gap in zip(clips, gaps):
+        frames = audio_frames(clip)
+        parts.extend(frames)
+        if gap > 0 and frames: parts.append(silence(gap, like=frames[0]))
+    return b"".join(parts)
+
+
+class SegmentAssembler:
+    # synthesize は async (text, voice) -> bytes
+    # つなぎ合わせはループの外で行う (executor に ProcessPoolExecutor などを渡せばそちらで。既定はスレッドプール)
+    def __init__(self, cache, synthesize, gaps=None, concurrency=8, fmt=DEFAULT_FORMAT, executor=None):
+        self.cache = cache
+        self.synthesize = synthesize
+        self.gaps = dict(DEFAULT_GAPS, **(gaps or {}))
+        self.concurrency = concurrency
+        self.fmt = fmt
+        self.executor = executor
+
+    async def assemble(self, phrases, voice):
+        clips = {}
+        missing = []
+        for text in dict.fromkeys(text for text, _ in phrases):
+            data = await self.cache.aget(make_key(text, voice, self.fmt))
+            if data is None: missing.append(text)
+            else: clips[text] = data
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(text):
+            async with semaphore:
+                data = await self.synthesize(text, voice)
+            if not data: raise RuntimeError(f"音声を合成できませんでした: {text!r}")
+            await self.cache.aput(make_key(text, voice, self.fmt), data)
+            clips[text] = data
+
+        await asyncio.gather(*(fetch(text) for text in missing))
+        ordered_clips = [clips[text] for text, _ in phrases]
+        gaps = [self.gaps[kind] for _, kind in phrases]
+        return await asyncio.get_running_loop().run_in_executor(self.executor, splice, ordered_clips, gaps)
@@ -0,0 +1,122 @@
+# セッションをまたいで共有する値の置き場 (参照カウント + LRU、合計サイズに上限)
+# セッション側は小さなハンドル (キー) だけを持ち、値の本体はここに1つだけ置く。
+# 参照されている値は追い出さず、参照のなくなった値を上限を超えた分だけ古い順に捨てる。
+# しばらく操作のないセッションの参照は外す (ハンドルは残るので、次に使うときに読み直すだけで続きから使える)。
+#
+#   store = SessionStore(budget=128 * 1024**2, idle_seconds=600)
+#   src = store.acquire(session_id, "player", key, lambda: load(key))
+#   store.touch(session_id)    # 再実行のたびに。ときどき放置されたセッションの参照を外す
+import threading
+import time
+from collections import OrderedDict
+
+
+def _size(value):
+    return len(value) if isinstance(value, (bytes, bytearray, str)) else 0
+
+
+class SessionStore:
+    def __init__(self, budget=128 * 1024 * 1024, idle_seconds=600, sweep_interval=30):
+        self.budget = budget
+        self.idle_seconds = idle_seconds
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # キー -> [値, サイズ, 参照数]
+        self._holds = {}  # セッション -> {用途: キー}
+        self._seen = {}   # セッション -> 最後に使われた時刻
+        self._bytes = 0
+        self._swept_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.released = 0  # 放置されて参照を外したセッションの数
+
+    # --- 取得 (参照を持つ) ---
+    # owner の slot (用途) ごとに参照は1つ。同じ slot で別のキーを取れば前の参照は外れる
+    def acquire(self, owner, slot, key, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            value = loader()  # 読み込みはロックの外で (同時に同じキーを読んだときは先に入れた方を使う)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._entries[key] = [value, _size(value), 0]
+                    self._bytes += entry[1]
+                    self.misses += 1
+        with self._lock:
+            if key not in self._entries:  # 読み込みの間に追い出されていたら戻す
+                self._entries[key] = entry
+                self._bytes += entry[1]
+            self._hold(owner, slot, key)
+            self._seen[owner] = time.monotonic()
+            self._evict()
+            return entry[0]
+
+    def _hold(self, owner, slot, key):
+        holds = self._holds.setdefault(owner, {})
+        old = holds.get(slot)
+        if old == key: return
+        if old is not None: self._unref(old)
+        holds[slot] = key
+        self._entries[key][2] += 1
+
+    def _unref(self, key):
+        entry = self._entries.get(key)
+        if entry is not None: entry[2] -= 1
+
+    # --- 参照を外す ---
+    def release(self, owner, slot=None):
+        with self._lock:
+            holds = self._holds.get(owner, {})
+            for name in [slot] if slot is not None else list(holds):
+                key = holds.pop(name, None)
+                if key is not None: self._unref(key)
+            if not holds: self._holds.pop(owner, None)
+            self._evict()
+
+    def touch(self, owner):
+        now = time.monotonic()
+        with self._lock:
+            self._seen[owner] = now
+            if now - self._swept_at < self.sweep_interval: return
+            self._swept_at = now
+        self.sweep(now)
+
+    # idle_seconds 以上使われていないセッションの参照を外す (タブを閉じたセッションもここで片付く)
+    def sweep(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [owner for owner, seen in self._seen.items() if now - seen >= self.idle_seconds]
+            for owner in idle:
+                del self._seen[owner]
+                for key in self._holds.pop(owner, {}).values(): self._unref(key)
+            self.released += len(idle)
+            self._evict()
+        return len(idle)
+
+    def _evict(self):
+        if self._bytes <= self.budget: return
+        for key in [key for key, entry in self._entries.items() if not entry[2]]:
+            if self._bytes <= self.budget: break
+            self._bytes -= self._entries.pop(key)[1]
+            self.evictions += 1
+
+    # --- 統計 ---
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'pinned_bytes': sum(size for _, size, refs in self._entries.values() if refs),
+                'budget': self.budget,
+                'sessions': len(self._seen),
+                'holding_sessions': len(self._holds),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'released_sessions': self.released,
+            }
@@ -0,0 +1,52 @@
+# 読み上げテキストの組み立て
+# 問題全体の文章 (generate_audio_text) と、フレーズ単位の分割 (speech_phrases) は同じ規則から作る
+from number_words import SCALES, numbers_to_words
+
+CLOSING = "That's all."
+SCALE_WORDS = set(SCALES[1:])
+
+
+# 各行を (前置き, 数字の読み, 区切り) に分解
+def speech_rows(row_data):
+    rows = []
+    n = len(row_data)
+    for i, (num, words) in enumerate(zip(row_data, numbers_to_words(row_data))):
+        delimiter = "." if (i + 1) % 3 == 0 else ","
+        if i == 0: prefix = "Starting with,"
+        elif i == n - 1: prefix = "and,"
+        elif num < 0: prefix = "Minus"
+        else: prefix = None
+        rows.append((prefix, words, delimiter))
+    return rows
+
+
+# 読み上げテキスト生成
+def generate_audio_text(row_data):
+    speech_parts = [f"{prefix} {words}{delimiter}" if prefix else f"{words}{delimiter}"
+                    for prefix, words, delimiter in speech_rows(row_data)]
+    speech_parts.append(CLOSING)
+    return " ".join(speech_parts)
+
+
+# "nine hundred seventy-eight thousand fourteen" -> ["nine hundred seventy-eight thousand", "fourteen"]
+def split_scale_chunks(words):
+    chunks, current = [], []
+    for token in words.split():
+        current.append(token)
+        if token in SCALE_WORDS:
+            chunks.append(" ".join(current)); current = []
+    if current: chunks.append(" ".join(current))
+    return chunks
+
+
+# フレーズ単位の分割: [(フレーズ, 直後の間の種類), ...]
+# 間の種類は 'prefix' / 'word' / ',' / '.' / 'end'
+def speech_phrases(row_data):
+    phrases = []
+    for prefix, words, delimiter in speech_rows(row_data):
+        if prefix: phrases.append((prefix, 'prefix'))
+        chunks = split_scale_chunks(words)
+        phrases.extend((chunk, 'word') for chunk in chunks[:-1])
+        phrases.append((chunks[-1], delimiter))
+    phrases.append((CLOSING, 'end'))
+    return phrases
@@ -0,0 +1,67 @@
+# 背景画像などの静的ファイルを Streamlit の静的配信 (static/) に置き、URL で配る
+# ファイル名に中身のハッシュを入れるので、中身が変わらない限りブラウザは一度取得したものを使い続けられる
+# (変われば別の名前になるので、古いキャッシュを掴むことはない)。
+# Pillow があれば、画面幅ごとに縮小・再圧縮した版 (WebP) も作っておく。なければ元のファイルをそのまま配る。
+# すでに作ってあるものは作り直さないので、2回目以降の起動ではハッシュを計算するだけで済む。
+import hashlib
+import io
+import os
+
+from atomic_file import write_atomic
+
+DEFAULT_WIDTHS = (960, 1920)
+WEBP_QUALITY = 80
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _resized(data, width, quality):
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if getattr(image, "is_animated", False): return None  # アニメーションはそのまま配る
+            if image.width > width:
+                image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            out = io.BytesIO()
+            image.save(out, "WEBP", quality=quality, method=4)
+            return out.getvalue()
+    except (OSError, ValueError):  # 壊れた画像・読めない形式 (UnidentifiedImageError も OSError) は元のファイルを配る
+        return None
+
+
+class StaticAssets:
+    def __init__(self, out_dir, url_base):
+        self.out_dir = out_dir
+        self.url_base = url_base
+
+    def _put(self, name, data):
+        path = os.path.join(self.out_dir, name)
+        if not os.path.exists(path): write_atomic(path, data)  # 名前に中身のハッシュが入っているので、あれば同じもの
+        return self.url_base + name
+
+    # 元のファイルを配る。widths を指定すると、その幅以下に縮小した版の URL も返す ({幅: URL}。作れなかった幅は入らない)
+    def publish(self, path, widths=(), quality=WEBP_QUALITY):
+        with open(path, 'rb') as f: data = f.read()
+        stem, ext = os.path.splitext(os.path.basename(path))
+        digest = _digest(data)
+        url = self._put(f"{stem}-{digest}{ext.lower()}", data)
+        variants = {}
+        for width in widths:
+            name = f"{stem}-{digest}-{width}w-q{quality}.webp"
+            if os.path.exists(os.path.join(self.out_dir, name)):
+                variants[width] = self.url_base + name
+                continue
+            resized = _resized(data, width, quality)
+            if resized: variants[width] = self._put(name, resized)
+        return url, variants
+
+    # 文字列 (CSS など) をファイルとして配る
+    def publish_text(self, name, text):
+        data = text.encode('utf-8')
+        stem, ext = os.path.splitext(name)
+        return self._put(f"{stem}-{_digest(data)}{ext}", data)
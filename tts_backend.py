@@ -0,0 +1,189 @@
+# 音声合成の差し替え口
+# どの実装も async synthesize(text, voice, cancel_event=None) -> bytes (MP3) を持つ。
+# 中断された (cancel_event がセットされた) ときは None を返す。
+import asyncio
+import io
+import random
+import shutil
+import threading
+import time
+
+from metrics import REGISTRY
+from segment_audio import silence
+
+
+class TTSBackend:
+    name = "base"
+
+    async def synthesize(self, text, voice, cancel_event=None):
+        raise NotImplementedError
+
+
+# Microsoft Edge の読み上げ (edge-tts)
+# 合成ごとの WebSocket はサービス側の都合で使い回せないが、TCP/TLS の接続プールと DNS の結果は
+# イベントループごとに1つの connector を共有して使い回す。
+class EdgeTTSBackend(TTSBackend):
+    name = "edge"
+
+    def __init__(self, connection_limit=0):
+        self.connection_limit = connection_limit
+        self._connectors = {}  # イベントループ -> connector
+
+    def _connector(self):
+        loop = asyncio.get_running_loop()
+        connector = self._connectors.get(loop)
+        if connector is None:
+            import aiohttp
+
+            # edge-tts は合成のたびに ClientSession を閉じ、そのとき connector も閉じてしまうので閉じさせない
+            class SharedConnector(aiohttp.TCPConnector):
+                def close(self, *args, **kwargs):
+                    return asyncio.sleep(0)
+
+            connector = SharedConnector(limit=self.connection_limit, ttl_dns_cache=300)
+            self._connectors = {l: c for l, c in self._connectors.items() if not l.is_closed()}
+            self._connectors[loop] = connector
+        return connector
+
+    async def synthesize(self, text, voice, cancel_event=None):
+        import edge_tts
+        communicate = edge_tts.Communicate(text, voice, connector=self._connector())
+        buffer = io.BytesIO()  # bytes の += は毎回コピーが走るのでバッファに追記する
+        started = time.perf_counter()
+        async for chunk in communicate.stream():
+            if cancel_event is not None and cancel_event.is_set(): return None
+            if chunk["type"] == "audio":
+                if not buffer.tell(): REGISTRY.observe("stage_seconds", time.perf_counter() - started, stage="tts_first_byte")
+                buffer.write(chunk["data"])
+        return buffer.getvalue()
+
+
+# ネットワークなしで動くローカルの読み上げ: espeak-ng で WAV を作り、ffmpeg で MP3 にする
+# 音質は落ちるが、サービスに繋がらない環境や負荷試験で使える
+class LocalTTSBackend(TTSBackend):
+    name = "local"
+
+    def __init__(self, espeak="espeak-ng", ffmpeg="ffmpeg", words_per_minute=170):
+        missing = [cmd for cmd in (espeak, ffmpeg) if shutil.which(cmd) is None]
+        if missing: raise RuntimeError(f"ローカル読み上げに必要なコマンドが見つかりません: {', '.join(missing)}")
+        self.espeak, self.ffmpeg = espeak, ffmpeg
+        self.words_per_minute = words_per_minute
+
+    @staticmethod
+    def _espeak_voice(voice):
+        # "en-US-JennyNeural" -> "en-us" (アメリカ・カナダ以外はイギリス英語)
+        region = voice.split("-")[1] if voice.count("-") >= 2 else ""
+        return "en-us" if region in ("US", "CA") else "en"
+
+    async def _run(self, args, data=None):
+        process = await asyncio.create_subprocess_exec(
+            *args, stdin=asyncio.subprocess.PIPE if data is not None else None,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try: out, err = await process.communicate(data)
+        except asyncio.CancelledError:
+            process.kill(); raise
+        if process.returncode: raise RuntimeError(f"{args[0]} が失敗しました: {err.decode(errors='replace').strip()}")
+        return out
+
+    async def synthesize(self, text, voice, cancel_event=None):
+        wav = await self._run([self.espeak, "-v", self._espeak_voice(voice), "-s", str(self.words_per_minute), "--stdout", text])
+        if cancel_event is not None and cancel_event.is_set(): return None
+        return await self._run([self.ffmpeg, "-loglevel", "error", "-f", "wav", "-i", "pipe:0",
+                                "-ar", "24000", "-ac", "1", "-b:a", "48k", "-f", "mp3", "pipe:1"], wav)
+
+
+# テスト・ベンチマーク用の偽物: 文字数に比例した長さの無音 MP3 を返す (同じ入力なら同じ出力)
+class FakeBackend(TTSBackend):
+    name = "fake"
+
+    def __init__(self, latency=0.0, seconds_per_char=0.06):
+        self.latency = latency
+        self.seconds_per_char = seconds_per_char
+        self.calls = 0
+
+    async def synthesize(self, text, voice, cancel_event=None):
+        self.calls += 1
+        started = time.perf_counter()
+        if self.latency: await asyncio.sleep(self.latency)
+        REGISTRY.observe("stage_seconds", time.perf_counter() - started, stage="tts_first_byte")
+        if cancel_event is not None and cancel_event.is_set(): return None
+        return silence(max(0.1, len(text) * self.seconds_per_char))
+
+
+# 別のバックエンドを包んで、
+#   - 同時に合成する数を全体で limit までに制限する
+#   - 1回の合成が timeout 秒を超えたら打ち切る
+#   - 失敗したら retries 回まで、間隔を倍々に (ゆらぎ付きで) 空けてやり直す
+# in_flight は今まさに合成中の数
+class ResilientBackend(TTSBackend):
+    def __init__(self, backend, limit=8, timeout=30.0, retries=2, backoff=0.5):
+        self.backend = backend
+        self.name = backend.name
+        self.limit = limit
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.in_flight = 0
+        self.failures = 0
+        self._semaphores = {}  # Semaphore は作ったイベントループでしか使えないのでループごとに持つ
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            self._semaphores = {l: s for l, s in self._semaphores.items() if not l.is_closed()}
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+        return semaphore
+
+    async def _attempt(self, text, voice, cancel_event):
+        async with self._semaphore():
+            self.in_flight += 1
+            try:
+                with REGISTRY.timer("stage_seconds", stage="tts_total"):
+                    return await asyncio.wait_for(self.backend.synthesize(text, voice, cancel_event), self.timeout)
+            except asyncio.TimeoutError:
+                REGISTRY.inc("tts_timeouts_total"); raise
+            finally: self.in_flight -= 1
+
+    async def synthesize(self, text, voice, cancel_event=None):
+        for attempt in range(self.retries + 1):
+            try: return await self._attempt(text, voice, cancel_event)
+            except Exception:
+                self.failures += 1
+                REGISTRY.inc("tts_failures_total")
+                if attempt == self.retries or (cancel_event is not None and cancel_event.is_set()): raise
+            REGISTRY.inc("tts_retries_total")
+            await asyncio.sleep(self.backoff * 2**attempt * random.uniform(0.5, 1.5))
+
+
+# プロセスに1つの、長生きするイベントループ (専用スレッドで回す)
+# 再実行のたびに asyncio.run でループを作り直さないので、connector やセマフォをセッションをまたいで共有できる。
+# 全セッションの合成がこの1本のループに乗るので、ループ上ではブロックする処理をしない
+# (キャッシュは AudioCache.aget / aput、つなぎ合わせは run_in_executor でスレッドプールに逃がす)。
+#   service.run(coro)     終わるまで待って結果を返す
+#   service.submit(coro)  concurrent.futures.Future を返す (cancel() でタスクも止まる)
+class TTSService:
+    def __init__(self, backend):
+        self.backend = backend
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="tts-loop", daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        return self.submit(coro).result(timeout)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+BACKENDS = {cls.name: cls for cls in (EdgeTTSBackend, LocalTTSBackend, FakeBackend)}
+
+
+def create_backend(name, **options):
+    if name not in BACKENDS: raise ValueError(f"未知のTTSバックエンドです: {name} (使えるもの: {', '.join(BACKENDS)})")
+    return BACKENDS[name](**options)
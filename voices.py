@@ -0,0 +1,29 @@
+# ボイス設定（多国籍版 + ランダム）
+VOICE_MAP = {
+    "🎲 ランダム (Random)": "random",
+    "🇺🇸 米国 - 女性 (Mary)": "en-US-JennyNeural", 
+    "🇺🇸 米国 - 男性 (James)": "en-US-GuyNeural",
+    "🇨🇦 カナダ - 女性 (Jennifer)": "en-CA-ClaraNeural",
+    "🇨🇦 カナダ - 男性 (Robert)": "en-CA-LiamNeural",
+    "🇬🇧 英国 - 女性 (Margaret)": "en-GB-LibbyNeural",
+    "🇬🇧 英国 - 男性 (David)": "en-GB-RyanNeural",
+    "🇮🇪 アイルランド - 女性 (Mary)": "en-IE-EmilyNeural",
+    "🇮🇪 アイルランド - 男性 (Patrick)": "en-IE-ConnorNeural",
+    "🇦🇺 豪州 - 女性 (Charlotte)": "en-AU-NatashaNeural",
+    "🇦🇺 豪州 - 男性 (John)": "en-AU-WilliamNeural",
+    "🇳🇿 ニュージーランド - 女性 (Molly)": "en-NZ-MollyNeural",
+    "🇳🇿 ニュージーランド - 男性 (Mitchell)": "en-NZ-MitchellNeural",
+    "🇮🇳 インド - 女性 (Priya)": "en-IN-NeerjaNeural",
+    "🇮🇳 インド - 男性 (Rahul)": "en-IN-PrabhatNeural",
+    "🇸🇬 シンガポール - 女性 (Luna)": "en-SG-LunaNeural",
+    "🇸🇬 シンガポール - 男性 (Wayne)": "en-SG-WayneNeural",
+    "🇵🇭 フィリピン - 女性 (Rosa)": "en-PH-RosaNeural",
+    "🇵🇭 フィリピン - 男性 (James)": "en-PH-JamesNeural",
+    "🇿🇦 南アフリカ - 女性 (Leah)": "en-ZA-LeahNeural",
+    "🇿🇦 南アフリカ - 男性 (Luke)": "en-ZA-LukeNeural",
+    "🇳🇬 ナイジェリア - 女性 (Ezinne)": "en-NG-EzinneNeural",
+    "🇳🇬 ナイジェリア - 男性 (Abeo)": "en-NG-AbeoNeural",
+}
+
+# "random" 以外の実在する声
+VOICE_IDS = [v for v in VOICE_MAP.values() if v != "random"]
@@ -1,66 +1,79 @@
+import time
+SCRIPT_STARTED = time.perf_counter()  # 起動時間の計測用 (最初の実行ではこの下の import の時間も含む)
 import streamlit as st
 import os
-import csv
 import base64
-import time
-import asyncio
-import edge_tts
 import random
-import io
-from num2words import num2words
+import asyncio
+import threading
+import uuid
+import itertools
+import audio_render
+import exam_audio
+from audio_cache import AudioCache, DEFAULT_DISK_BUDGET, DEFAULT_FORMAT
+from learner_stats import DIMENSIONS, LearnerStats
+from metrics import BYTES_BUCKETS, REGISTRY, log_event
+from problem_catalog import ProblemCatalog, ProblemSet
+from problem_generator import batch_to_problems, deal_digits, generate_problems, problem_from_digits
+from segment_audio import DEFAULT_GAPS
+from session_store import SessionStore
+from static_assets import StaticAssets
+from tts_backend import ResilientBackend, TTSService, create_backend
+from voices import VOICE_IDS, VOICE_MAP
 
 # --- 設定 ---
 APP_NAME_EN = "Bonjour, Yomiagesan"
 APP_NAME_JP = "こんにちは、読み上げ算"
 DATA_DIR = "data"
+PROBLEM_INDEX_DIR = ".problem_index"     # 大きな問題CSVの行位置の索引
+LAZY_PROBLEM_BYTES = 1024 * 1024         # これ以上のCSVは丸ごと読まず、1問ずつ読む
+PROBLEM_MMAP = False                     # 索引とCSVをメモリマップで読む
 BG_IMAGE = "background.png"
 LOADING_IMAGE = "loading.gif"
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")  # Streamlit が配るのは「実行するスクリプトの隣の static/」(起動したディレクトリには依らない)
+ASSET_DIR = os.path.join(STATIC_DIR, "assets")  # 背景画像・CSS などを中身のハッシュ付きの名前で置き、app/static/assets/ から配る
+ASSET_URL_BASE = "app/static/assets/"
+BG_IMAGE_WIDTHS = (960, 1920)  # 背景画像を縮小・再圧縮した版の幅 (Pillow があるときだけ作る)。狭い画面には小さい方を使う
+AUDIO_CACHE_DIR = os.path.join(STATIC_DIR, "audio")  # Streamlit の静的配信 (enableStaticServing) でそのまま配る
+AUDIO_URL_BASE = "app/static/audio/"
+AUDIO_FORMAT = DEFAULT_FORMAT
+AUDIO_MEM_BUDGET = 64 * 1024 * 1024     # メモリ上のLRU (バイト)
+AUDIO_DISK_BUDGET = DEFAULT_DISK_BUDGET  # ディスク上の保存領域 (バイト。prerender.py と共通)
+SESSION_AUDIO_BUDGET = 128 * 1024 * 1024  # 静的配信を使わないときに、各セッションのプレーヤーへ渡す音声 (base64) を全セッションで合わせて置いておく上限 (バイト)
+SESSION_IDLE_RELEASE = 600               # これだけ操作のないセッションは音声の参照を外す (秒)。問題番号などはそのまま残る
+PREFETCH_DEPTH = 2      # 何問先まで先読みするか
+PREFETCH_WAIT = 30      # 先読み中の音声を待つ上限 (秒)
+VOICE_FANOUT_CONCURRENCY = 6  # 複数の声をまとめて用意するときの同時合成数 (1セッションあたり)
+COUNTDOWN_SECONDS = 3   # 再生前のカウントダウン (音声合成と並行して進む)
+SEGMENT_AUDIO_IN_RANDOM_MODE = True  # ランダム生成ではフレーズ単位の音声をつなぎ合わせる
+SEGMENT_GAPS = dict(DEFAULT_GAPS)    # フレーズ間の無音 (秒)
+SEGMENT_CONCURRENCY = 8              # 足りないフレーズを同時に合成する数
+EXAM_MAX_PROBLEMS = 100             # 模擬試験の問題数の上限
+EXAM_CONCURRENCY = 8                 # 模擬試験で同時に用意する問題数
+EXAM_POLL_MS = 500                   # 模擬試験のプレーヤーが次の問題の音声を待つ間隔 (ミリ秒)
+TTS_BACKEND = "edge"                 # 音声合成の実装 (tts_backend.BACKENDS のいずれか)
+TTS_CONCURRENCY = 16                 # 同時に合成する数 (全セッション合計)
+TTS_TIMEOUT = 30                     # 1回の合成の上限 (秒)
+TTS_RETRIES = 2                      # 合成に失敗したときの再試行回数
+METRICS_TEXTFILE = "metrics.prom"    # 計測値 (Prometheus テキスト形式)。静的配信 (static/) の外に置き、生徒からは見えない。None で書かない
+METRICS_LOG = None                   # 再生ごとの計測を JSON Lines で残すファイル (None で残さない)
+ADMIN_PANEL = os.environ.get("YOMIAGE_ADMIN") == "1"  # サイドバーに計測パネル・学習の記録を出す (先生用。サーバー側で YOMIAGE_ADMIN=1 のときだけ)
+STATS_DIR = "learner_stats"          # 答え合わせの記録 (日ごとのファイル) と集計の置き場。None で記録しない
 
-# --- ボイス設定（多国籍版 + ランダム） ---
-VOICE_MAP = {
-    "🎲 ランダム (Random)": "random",
-    "🇺🇸 米国 - 女性 (Mary)": "en-US-JennyNeural", 
-    "🇺🇸 米国 - 男性 (James)": "en-US-GuyNeural",
-    "🇨🇦 カナダ - 女性 (Jennifer)": "en-CA-ClaraNeural",
-    "🇨🇦 カナダ - 男性 (Robert)": "en-CA-LiamNeural",
-    "🇬🇧 英国 - 女性 (Margaret)": "en-GB-LibbyNeural",
-    "🇬🇧 英国 - 男性 (David)": "en-GB-RyanNeural",
-    "🇮🇪 アイルランド - 女性 (Mary)": "en-IE-EmilyNeural",
-    "🇮🇪 アイルランド - 男性 (Patrick)": "en-IE-ConnorNeural",
-    "🇦🇺 豪州 - 女性 (Charlotte)": "en-AU-NatashaNeural",
-    "🇦🇺 豪州 - 男性 (John)": "en-AU-WilliamNeural",
-    "🇳🇿 ニュージーランド - 女性 (Molly)": "en-NZ-MollyNeural",
-    "🇳🇿 ニュージーランド - 男性 (Mitchell)": "en-NZ-MitchellNeural",
-    "🇮🇳 インド - 女性 (Priya)": "en-IN-NeerjaNeural",
-    "🇮🇳 インド - 男性 (Rahul)": "en-IN-PrabhatNeural",
-    "🇸🇬 シンガポール - 女性 (Luna)": "en-SG-LunaNeural",
-    "🇸🇬 シンガポール - 男性 (Wayne)": "en-SG-WayneNeural",
-    "🇵🇭 フィリピン - 女性 (Rosa)": "en-PH-RosaNeural",
-    "🇵🇭 フィリピン - 男性 (James)": "en-PH-JamesNeural",
-    "🇿🇦 南アフリカ - 女性 (Leah)": "en-ZA-LeahNeural",
-    "🇿🇦 南アフリカ - 男性 (Luke)": "en-ZA-LukeNeural",
-    "🇳🇬 ナイジェリア - 女性 (Ezinne)": "en-NG-EzinneNeural",
-    "🇳🇬 ナイジェリア - 男性 (Abeo)": "en-NG-AbeoNeural",
-}
 
-# 【軽量化1】背景画像の処理をキャッシュ化
-@st.cache_data
-def get_base64_of_bin_file(bin_file):
-    with open(bin_file, 'rb') as f:
-        data = f.read()
-    return base64.b64encode(data).decode()
+FONTS_LINK = '<link href="https://fonts.googleapis.com/css2?family=Dancing+Script:wght@700&display=swap" rel="stylesheet">'
 
-def set_bg_image(image_file):
-    if not os.path.exists(image_file): return
-    b64_encoded = get_base64_of_bin_file(image_file)
-    style = f"""
-    <style>
+# 画面全体の CSS (background_url は背景画像の URL か data URI)
+def app_css(background_url, small_background_url=None):
+    small_background = (f'@media (max-width: 960px) {{ .stApp {{ background-image: url("{small_background_url}"); }} }}'
+                        if small_background_url else "")
+    return f"""
     @keyframes fadeInUp {{
         0% {{ opacity: 0; transform: translateY(20px); }}
         100% {{ opacity: 1; transform: translateY(0); }}
     }}
     .stApp {{
-        background-image: url("data:image/png;base64,{b64_encoded}");
+        background-image: url("{background_url}");
         background-attachment: fixed;
         background-size: cover;
         background-position: center;
@@ -147,6 +160,7 @@ def set_bg_image(image_file):
         background-color: #FFFFFF !important;
         color: #2D3748 !important;
     }}
+    {small_background}
     @media (max-width: 640px) {{
         h1 {{ font-size: 2.0rem !important; }}
         .block-container {{ padding: 1.5rem !important; margin-top: 0.5rem; }}
@@ -184,277 +198,659 @@ def set_bg_image(image_file):
         }}
         .streamlit-expanderHeader {{ color: #E2E8F0 !important; }}
     }}
-    </style>
-    <link href="https://fonts.googleapis.com/css2?family=Dancing+Script:wght@700&display=swap" rel="stylesheet">
     """
-    st.markdown(style, unsafe_allow_html=True)
+
+# 【軽量化1】背景画像の処理をキャッシュ化
+@st.cache_data
+def get_base64_of_bin_file(bin_file):
+    with open(bin_file, 'rb') as f:
+        data = f.read()
+    return base64.b64encode(data).decode()
+
+# 背景画像・読み込み中の画像・CSS を静的配信に置く (プロセスごとに1回。作ってあるものは作り直さない)
+@st.cache_resource
+def get_static_assets():
+    if not st.get_option("server.enableStaticServing"): return {}
+    with REGISTRY.timer("stage_seconds", stage="assets"):
+        assets, urls = StaticAssets(ASSET_DIR, ASSET_URL_BASE), {}
+        if os.path.exists(BG_IMAGE):
+            background, variants = assets.publish(BG_IMAGE, BG_IMAGE_WIDTHS)
+            # CSS と同じディレクトリに置くので、CSS からはファイル名だけで参照する
+            name = lambda url: url[len(ASSET_URL_BASE):]
+            css = app_css(name(variants.get(max(BG_IMAGE_WIDTHS), background)),
+                          name(variants[min(BG_IMAGE_WIDTHS)]) if min(BG_IMAGE_WIDTHS) in variants else None)
+            urls['css'] = assets.publish_text("app.css", css)
+        if os.path.exists(LOADING_IMAGE): urls['loading'] = assets.publish(LOADING_IMAGE)[0]
+    return urls
+
+# 静的配信が使えれば CSS はURLで読ませる (再実行のたびに送るのは <link> の1行だけで、ブラウザのキャッシュも効く)
+def set_bg_image(image_file):
+    if not os.path.exists(image_file): return
+    css_url = get_static_assets().get('css')
+    if css_url:
+        st.markdown(f'<link rel="stylesheet" href="{css_url}">\n{FONTS_LINK}', unsafe_allow_html=True)
+    else:
+        b64_encoded = get_base64_of_bin_file(image_file)
+        st.markdown(f"<style>{app_css(f'data:image/png;base64,{b64_encoded}')}</style>\n{FONTS_LINK}", unsafe_allow_html=True)
+
+# 起動してから最初のページの頭 (背景・タイトル) を送るまでの時間 (プロセスごとに最初の1回だけ記録する)
+@st.cache_resource
+def get_startup_timing():
+    return {}
+
+def record_startup():
+    timing = get_startup_timing()
+    if timing: return
+    timing['seconds'] = time.perf_counter() - SCRIPT_STARTED
+    REGISTRY.observe("stage_seconds", timing['seconds'], stage="startup")
+    REGISTRY.register("startup_seconds", lambda: timing['seconds'])
 
 # --- 共通関数 ---
+# 問題CSVは全セッション共有のカタログに一度だけ読み込む（更新日時・サイズが変われば読み直す）
+@st.cache_resource
+def get_problem_catalog():
+    return ProblemCatalog(DATA_DIR, lazy_threshold=LAZY_PROBLEM_BYTES, index_dir=PROBLEM_INDEX_DIR, use_mmap=PROBLEM_MMAP)
+
 def get_problem_counts():
-    counts = {}
-    if not os.path.exists(DATA_DIR): return counts
-    files = sorted([f for f in os.listdir(DATA_DIR) if f.endswith(".csv")])
-    for f_name in files:
-        path = os.path.join(DATA_DIR, f_name)
-        try:
-            with open(path, mode='r', encoding='utf-8-sig') as f:
-                reader = csv.reader(f); next(reader, None)
-                counts[f_name] = sum(1 for row in reader if row)
-        except: counts[f_name] = 0
-    return counts
+    return get_problem_catalog().counts()
 
 def load_problems_from_csv(file_name):
-    problems = {}
-    path = os.path.join(DATA_DIR, file_name)
-    try:
-        with open(path, mode='r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                try:
-                    no = int(row['no'])
-                    nums = [int(row[f'row{i}']) for i in range(1, 100) if f'row{i}' in row and row[f'row{i}']]
-                    problems[no] = nums
-                except: continue
-        return problems
-    except: return {}
+    return get_problem_catalog().get(file_name)
 
 def get_next_digits_from_deck(rows, min_digit, max_digit):
-    if 'digit_deck' not in st.session_state: st.session_state['digit_deck'] = []
-    deck = st.session_state['digit_deck']
-    if deck and (min(deck) < min_digit or max(deck) > max_digit): deck = []
-    current_digits = []
-    digit_range = list(range(min_digit, max_digit + 1))
-    while len(current_digits) < rows:
-        if not deck:
-            new_set = digit_range[:]; random.shuffle(new_set); deck.extend(new_set)
-        current_digits.append(deck.pop(0))
-    st.session_state['digit_deck'] = deck
-    if min_digit not in current_digits:
-        target_idx = random.choice([i for i, d in enumerate(current_digits) if d != max_digit] or [0])
-        current_digits[target_idx] = min_digit
-    if max_digit not in current_digits:
-        target_idx = random.choice([i for i, d in enumerate(current_digits) if d != min_digit] or [0])
-        current_digits[target_idx] = max_digit
+    current_digits, st.session_state['digit_deck'] = deal_digits(st.session_state.get('digit_deck') or [], rows, min_digit, max_digit)
     return current_digits
 
-# 引き算の生成ロジック
 def generate_single_problem(min_digit, max_digit, rows, allow_subtraction):
-    digits_list = get_next_digits_from_deck(rows, min_digit, max_digit)
-    nums = []
-    current_total = 0
-    
-    minus_indices = set()
-    if allow_subtraction and rows > 2:
-        middle_rows_count = rows - 2
-        min_minus_count = (middle_rows_count + 1) // 2
-        
-        for _ in range(100):
-            temp_indices = []
-            consecutive_minus = 0 
-            
-            for i in range(middle_rows_count):
-                row_idx = i + 1 
-                
-                can_be_minus = (consecutive_minus < 2)
-                
-                is_minus = False
-                if can_be_minus:
-                    if random.random() < 0.7:
-                        is_minus = True
-                
-                if is_minus:
-                    temp_indices.append(row_idx)
-                    consecutive_minus += 1
-                else:
-                    consecutive_minus = 0 
-            
-            if len(temp_indices) >= min_minus_count:
-                minus_indices = set(temp_indices)
-                break
-    
-    for r, d in enumerate(digits_list):
-        min_val = 10**(d-1)
-        max_val = 10**d - 1
-        
-        if r in minus_indices:
-            limit = min(max_val, current_total)
-            if min_val <= limit:
-                val = random.randint(min_val, limit)
-                val = -val 
-            else:
-                val = random.randint(min_val, max_val)
-        else:
-            val = random.randint(min_val, max_val)
-        
-        nums.append(val)
-        current_total += val
-        
-    return nums
-
-# 読み上げテキスト生成
-def generate_audio_text(row_data):
-    speech_parts = []
-    n = len(row_data)
-    
-    for i, num in enumerate(row_data):
-        text_val = num2words(abs(num), lang='en').replace(",", "").replace(" and ", " ")
-        delimiter = "." if (i + 1) % 3 == 0 else ","
-
-        if i == 0:
-            speech_parts.append(f"Starting with, {text_val}{delimiter}")
-        elif i == n - 1:
-            speech_parts.append(f"and, {text_val}{delimiter}")
-        else:
-            if num < 0:
-                speech_parts.append(f"Minus {text_val}{delimiter}")
-            else:
-                speech_parts.append(f"{text_val}{delimiter}")
-    
-    speech_parts.append("That's all.")
-    return " ".join(speech_parts)
-
-# メモリ上で音声データを生成
-async def get_audio_bytes(text, voice):
-    communicate = edge_tts.Communicate(text, voice)
-    audio_stream = b""
-    async for chunk in communicate.stream():
-        if chunk["type"] == "audio":
-            audio_stream += chunk["data"]
-    return audio_stream
+    return problem_from_digits(get_next_digits_from_deck(rows, min_digit, max_digit), allow_subtraction)
+
+# 合成済み音声のキャッシュ（全セッション共有）
+@st.cache_resource
+def get_audio_cache():
+    cache = AudioCache(AUDIO_CACHE_DIR, mem_budget=AUDIO_MEM_BUDGET, disk_budget=AUDIO_DISK_BUDGET)
+    REGISTRY.register("audio_cache", cache.stats)
+    return cache
+
+# セッションのプレーヤーが使う音声の置き場 (全セッション共有)。セッション側はキーだけを持つ
+@st.cache_resource
+def get_session_store():
+    store = SessionStore(SESSION_AUDIO_BUDGET, SESSION_IDLE_RELEASE)
+    REGISTRY.register("session_store", store.stats)
+    return store
+
+# 答え合わせの記録と集計 (全セッション共有)
+@st.cache_resource
+def get_learner_stats():
+    stats = LearnerStats(STATS_DIR)
+    REGISTRY.register("learner_stats", stats.stats)
+    return stats
+
+# 音声合成の実装と、それを回すイベントループ (全セッション共有)
+@st.cache_resource
+def get_tts_service():
+    backend = ResilientBackend(create_backend(TTS_BACKEND), TTS_CONCURRENCY, TTS_TIMEOUT, TTS_RETRIES)
+    REGISTRY.register("tts_in_flight", lambda: backend.in_flight)
+    return TTSService(backend)
+
+# 問題1問分の音声を用意するコルーチン ((キャッシュのキー, 音声) を返す)
+# get_tts_service().run(...) / .submit(...) で共有のループに渡す
+def render_problem_audio(nums, voice, assemble=False, cancel_event=None):
+    return audio_render.render_problem_audio(
+        get_audio_cache(), get_tts_service().backend, nums, voice, assemble,
+        SEGMENT_GAPS, SEGMENT_CONCURRENCY, AUDIO_FORMAT, cancel_event)
+
+# 先読み・一括準備はキャッシュに入れるだけで、結果にはキーだけを残す (音声本体をセッションが抱え込まない)
+async def render_audio_key(nums, voice, assemble=False, cancel_event=None):
+    key, _ = await render_problem_audio(nums, voice, assemble, cancel_event)
+    return key
+
+# 🎲 ランダムは candidates (まとめて用意している声) があればその中から選ぶ
+def pick_voice(voice_id, candidates=None):
+    if voice_id != "random": return voice_id
+    return random.choice(candidates or VOICE_IDS)
+
+# セッションが持つ再生中の音声のハンドル (キーと、なくなっていたときに作り直すための問題・声) から音声を取り出す
+def load_audio(handle):
+    audio = get_audio_cache().get(handle['key'])
+    if audio is None:
+        _, audio = get_tts_service().run(render_problem_audio(handle['nums'], handle['voice'], handle['assemble']))
+    return audio
+
+# 音声はハッシュ名のファイルとして static/audio/ に置かれているので、プレーヤーにはURLだけを渡す
+# (再実行のたびに base64 の音声本体をブラウザへ送り直さずに済み、Range 指定やブラウザキャッシュも効く)
+# 静的配信が使えないときの base64 は共有の置き場に1つだけ作り、同じ音声を聞いているセッションで使い回す
+def get_audio_src(handle):
+    key = handle['key']
+    if not st.get_option("server.enableStaticServing"):
+        return get_session_store().acquire(session_id(), "player", key,
+                                           lambda: "data:audio/mp3;base64," + base64.b64encode(load_audio(handle)).decode())
+    cache = get_audio_cache()
+    if not cache.ensure_file(key): cache.put(key, load_audio(handle))  # メモリにもディスクにもなければ作り直す
+    return AUDIO_URL_BASE + cache.relpath_for(key)
+
+# --- 先読み（解答中に次の問題の音声を裏で合成しておく） ---
+def cancel_prefetch():
+    pf = st.session_state.get('prefetch')
+    if pf:
+        pf['cancel'].set()
+        for _, _, fut in pf['items'].values(): fut.cancel()
+    st.session_state['prefetch'] = None
+
+# 声・桁数・口数・引き算などの設定が変わったら先読み分は捨てる
+def sync_prefetch(signature):
+    pf = st.session_state.get('prefetch')
+    if pf and pf['sig'] == signature: return pf
+    cancel_prefetch()
+    pf = {'sig': signature, 'items': {}, 'cancel': threading.Event()}
+    st.session_state['prefetch'] = pf
+    return pf
+
+def schedule_prefetch(pf, q_no, nums, voice_id, assemble=False):
+    if q_no in pf['items']: return
+    voice = pick_voice(voice_id)
+    fut = get_tts_service().submit(render_audio_key(nums, voice, assemble, pf['cancel']))
+    pf['items'][q_no] = (nums, voice, fut)
+
+def drop_prefetched(pf, keep):
+    for q in [q for q in pf['items'] if q not in keep]:
+        pf['items'].pop(q)[2].cancel()
+
+def take_prefetched(q_no):
+    pf = st.session_state.get('prefetch')
+    if not pf or q_no not in pf['items']: return None
+    nums, voice, fut = pf['items'].pop(q_no)
+    REGISTRY.inc("prefetch_total", result="ready" if fut.done() else "pending")
+    with REGISTRY.timer("stage_seconds", stage="prefetch_wait"):
+        try: fut.result(timeout=PREFETCH_WAIT)  # 合成途中なら二重に合成せず、終わるのを待つ
+        except Exception: pass
+    return nums, voice
+
+# --- 声の一括準備（問題を選んだ時点で、選んだ複数の声の音声をまとめて合成しておく） ---
+# 声を切り替えたり 🎲 ランダムを引き直したりしても待たずに再生できる。別の問題に移ったら打ち切る。
+async def _with_limit(semaphore, coro):
+    try:
+        async with semaphore: return await coro
+    finally: coro.close()  # 始まる前に打ち切られたときの後始末
+
+def cancel_fanout():
+    fo = st.session_state.get('fanout')
+    if fo:
+        fo['cancel'].set()
+        for fut in fo['items'].values(): fut.cancel()
+    st.session_state['fanout'] = None
+
+def sync_fanout(nums, voices, assemble=False):
+    signature = (tuple(nums), tuple(voices), assemble)
+    fo = st.session_state.get('fanout')
+    if fo and fo['sig'] == signature: return
+    cancel_fanout()
+    if not nums or not voices: return
+    fo = {'sig': signature, 'items': {}, 'cancel': threading.Event()}
+    semaphore = asyncio.Semaphore(VOICE_FANOUT_CONCURRENCY)
+    service = get_tts_service()
+    for voice in voices:
+        fo['items'][voice] = service.submit(_with_limit(semaphore, render_audio_key(nums, voice, assemble, fo['cancel'])))
+    st.session_state['fanout'] = fo
+
+def fanout_voices(nums):
+    fo = st.session_state.get('fanout')
+    if not fo or fo['sig'][0] != tuple(nums): return []
+    return list(fo['items'])
+
+def wait_fanout(nums, voice):
+    fo = st.session_state.get('fanout')
+    if not fo or fo['sig'][0] != tuple(nums) or voice not in fo['items']: return
+    with REGISTRY.timer("stage_seconds", stage="fanout_wait"):
+        try: fo['items'][voice].result(timeout=PREFETCH_WAIT)  # 合成途中なら二重に合成せず、終わるのを待つ
+        except Exception: pass
+
+# カウントダウンの表示（ブラウザ側で進むので、その間もサーバーは音声合成を続けられる）
+COUNTDOWN_STYLE = """
+    text-align: center; 
+    font-size: 4em; 
+    font-weight: bold; 
+    color: #FF6B6B; 
+    text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
+"""
+
+def countdown_html(seconds):
+    return f"""
+        <div id="cd" style="{COUNTDOWN_STYLE} margin: 10px 0;">{seconds}</div>
+        <script>
+            var left = {seconds};
+            var timer = setInterval(function() {{
+                left -= 1;
+                document.getElementById("cd").innerText = left > 0 ? left : "";
+                if (left <= 0) {{ clearInterval(timer); }}
+            }}, 1000);
+        </script>
+    """
+
+# --- 計測 ---
+def session_id():
+    if 'session_id' not in st.session_state: st.session_state['session_id'] = uuid.uuid4().hex[:12]
+    return st.session_state['session_id']
+
+# 再生1回分の計測値をまとめて記録する
+def record_play(stages, q_no, voice, sent_bytes):
+    for stage, seconds in stages.items(): REGISTRY.observe("stage_seconds", seconds, stage=stage)
+    REGISTRY.inc("plays_total")
+    REGISTRY.inc("audio_bytes_total", sent_bytes)
+    REGISTRY.observe("play_audio_bytes", sent_bytes, BYTES_BUCKETS)
+    st.session_state['audio_bytes'] = st.session_state.get('audio_bytes', 0) + sent_bytes
+    if METRICS_LOG:
+        log_event(METRICS_LOG, session=session_id(), q_no=q_no, voice=voice, bytes=sent_bytes,
+                  stages={stage: round(seconds, 4) for stage, seconds in stages.items()})
+    if METRICS_TEXTFILE: REGISTRY.write_textfile(METRICS_TEXTFILE)
+
+def _labels(labels):
+    return "{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else ""
+
+def show_admin_panel():
+    snapshot = REGISTRY.snapshot()
+    with st.expander("📈 計測 (管理者用)"):
+        rows = [f"| {dict(labels).get('stage', name)} | {h['count']} | " + " | ".join(
+                    f"{h[p] * 1000:.0f}" if h[p] is not None else "-" for p in ('p50', 'p95', 'p99')) + " |"
+                for (name, labels), h in sorted(snapshot['histograms'].items()) if name == "stage_seconds"]
+        st.markdown("| 段階 | 回数 | p50 (ms) | p95 (ms) | p99 (ms) |\n|---|---|---|---|---|\n" + "\n".join(rows))
+        gauges = snapshot['gauges']
+        st.caption(f"キャッシュ命中率: {gauges.get('audio_cache_hit_rate', 0):.0%}  |  合成中: {gauges.get('tts_in_flight', 0)}  |  "
+                   f"このセッションの音声: {st.session_state.get('audio_bytes', 0) / 1024:.0f} KiB")
+        st.caption(f"共有の音声置き場: {gauges.get('session_store_bytes', 0) / 1024**2:.1f} / {SESSION_AUDIO_BUDGET / 1024**2:.0f} MiB "
+                   f"(参照中 {gauges.get('session_store_pinned_bytes', 0) / 1024**2:.1f} MiB)  |  "
+                   f"セッション: {gauges.get('session_store_sessions', 0)}  |  "
+                   f"メモリ上の音声キャッシュ: {gauges.get('audio_cache_memory_bytes', 0) / 1024**2:.1f} MiB")
+        counters = {name + _labels(labels): value for (name, labels), value in snapshot['counters'].items()}
+        st.caption("  |  ".join(f"{name}: {value:,}" for name, value in sorted(counters.items())))
+
+# 再生中の音声のハンドルからプレーヤーを組み立てる (再実行ごとに作り直すが、中身が同じならブラウザ側はそのまま)
+def player_html(handle):
+    audio_src, player_id = get_audio_src(handle), handle['player_id']
+    base_speed, remaining_ms = handle['speed'], handle['remaining_ms']
+    return f"""
+        <div class="custom-card" style="position: relative;">
+            <div id="cd_{player_id}" style="display: none; position: absolute; inset: 0; align-items: center; justify-content: center; background: rgba(255, 255, 255, 0.92); {COUNTDOWN_STYLE}"></div>
+            <audio id="{player_id}" controls preload="auto" style="width: 100%; margin-bottom: 10px;">
+                <source src="{audio_src}" type="audio/mpeg">
+            </audio>
+            <div style="display: flex; align-items: center; gap: 10px;">
+                <span style="font-size: 1.2em;">🕰️</span>
+                <input type="range" min="1" max="20" value="{int((base_speed - 0.5) * 10)}" step="1" style="flex-grow: 1; cursor: pointer;"
+                    oninput="
+                        var level = this.value;
+                        var rate = 0.5 + (level * 0.1);
+                        var audio = document.getElementById('{player_id}');
+                        if(audio) {{ audio.playbackRate = rate; }}
+                        document.getElementById('rate_disp_{player_id}').innerText = rate.toFixed(1) + 'x';
+                    "
+                >
+                <span id="rate_disp_{player_id}" style="font-weight: bold; width: 45px; text-align: right;">{base_speed:.1f}x</span>
+            </div>
+        </div>
+        <script>
+            var audio = document.getElementById("{player_id}");
+            var cd = document.getElementById("cd_{player_id}");
+            if(audio) {{ audio.playbackRate = {base_speed}; }}
+            function startPlayback() {{
+                cd.style.display = "none";
+                if(audio) {{ audio.play().catch(function() {{}}); }}
+            }}
+            var endAt = Date.now() + {remaining_ms};
+            function tick() {{
+                var left = endAt - Date.now();
+                if (left <= 0) {{ startPlayback(); return; }}
+                cd.style.display = "flex";
+                cd.innerText = Math.ceil(left / 1000);
+                setTimeout(tick, 100);
+            }}
+            tick();
+        </script>
+    """
 
 # 音声生成と再生（カウントダウン機能付き）
-def create_and_play_audio(q_no, problems, voice_id, base_speed):
+def create_and_play_audio(q_no, problems, voice_id, base_speed, actual_voice_id=None, assemble=False):
     if q_no not in problems: return
     
+    # 合成を始める前にカウントダウンを開始し、合成時間と重ねる
+    countdown_started = time.time()
+    stages = {}
+    countdown_placeholder = st.empty()
+    with countdown_placeholder:
+        st.components.v1.html(countdown_html(COUNTDOWN_SECONDS), height=110)
+
     loading_placeholder = st.empty()
-    if os.path.exists(LOADING_IMAGE):
+    if loading_url := get_static_assets().get('loading'):
+        loading_placeholder.markdown(f"<img src='{loading_url}' width='50'>", unsafe_allow_html=True)
+    elif os.path.exists(LOADING_IMAGE):
         loading_placeholder.image(LOADING_IMAGE, width=50)
     else:
         loading_placeholder.markdown("<span style='color:#718096; font-size:0.9em;'>Generating audio...</span>", unsafe_allow_html=True)
 
-    actual_voice_id = voice_id
-    if voice_id == "random":
-        available_voices = [v for k, v in VOICE_MAP.items() if v != "random"]
-        actual_voice_id = random.choice(available_voices)
+    actual_voice_id = actual_voice_id or pick_voice(voice_id, fanout_voices(problems[q_no]))
+    wait_fanout(problems[q_no], actual_voice_id)
 
-    full_text = generate_audio_text(problems[q_no])
-    
     try:
         # 音声生成
-        audio_bytes = asyncio.run(get_audio_bytes(full_text, actual_voice_id))
+        synth_started = time.perf_counter()
+        audio_key, audio_bytes = get_tts_service().run(render_problem_audio(problems[q_no], actual_voice_id, assemble))
+        stages['synthesis'] = time.perf_counter() - synth_started
         loading_placeholder.empty()
 
-        # --- カウントダウン処理 (3秒) ---
-        countdown_style = """
-        <div style='
-            text-align: center; 
-            font-size: 4em; 
-            font-weight: bold; 
-            color: #FF6B6B; 
-            text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            margin: 20px 0;
-            animation: fadeIn 0.5s;
-        '>
-        """
-        for i in range(3, 0, -1):
-            loading_placeholder.markdown(f"{countdown_style}{i}</div>", unsafe_allow_html=True)
-            time.sleep(1)
-        loading_placeholder.empty()
-        # ----------------------------
+        # カウントダウンの残り時間はプレーヤー側で引き継ぎ、終わり次第（読み込めていれば）すぐ再生する
+        remaining_ms = int(max(0.0, COUNTDOWN_SECONDS - (time.time() - countdown_started)) * 1000)
+        stages['countdown_remaining'] = remaining_ms / 1000
 
-        audio_b64 = base64.b64encode(audio_bytes).decode()
-        
-        player_id = f"ap_{int(time.time())}"
-        
-        audio_html = f"""
-            <div class="custom-card">
-                <audio id="{player_id}" controls autoplay style="width: 100%; margin-bottom: 10px;">
-                    <source src="data:audio/mp3;base64,{audio_b64}" type="audio/mp3">
-                </audio>
-                <div style="display: flex; align-items: center; gap: 10px;">
-                    <span style="font-size: 1.2em;">🕰️</span>
-                    <input type="range" min="1" max="20" value="{int((base_speed - 0.5) * 10)}" step="1" style="flex-grow: 1; cursor: pointer;"
-                        oninput="
-                            var level = this.value;
-                            var rate = 0.5 + (level * 0.1);
-                            var audio = document.getElementById('{player_id}');
-                            if(audio) {{ audio.playbackRate = rate; }}
-                            document.getElementById('rate_disp_{player_id}').innerText = rate.toFixed(1) + 'x';
-                        "
-                    >
-                    <span id="rate_disp_{player_id}" style="font-weight: bold; width: 45px; text-align: right;">{base_speed:.1f}x</span>
-                </div>
-            </div>
-            <script>
-                var audio = document.getElementById("{player_id}");
-                if(audio) {{ audio.playbackRate = {base_speed}; }}
-            </script>
-        """
-        st.session_state.update({'correct_ans': sum(problems[q_no]), 'audio_html': audio_html, 'current_q': q_no, 'last_voice_id': voice_id})
+        # セッションにはハンドルだけを残す (音声本体は共有のキャッシュ・置き場にある)
+        player = {'key': audio_key, 'nums': list(problems[q_no]), 'voice': actual_voice_id, 'assemble': assemble,
+                  'speed': base_speed, 'remaining_ms': remaining_ms, 'player_id': f"ap_{int(time.time())}"}
+        encode_started = time.perf_counter()
+        audio_src = get_audio_src(player)
+        stages['encode'] = time.perf_counter() - encode_started
+        countdown_placeholder.empty()
+        # 解答時間はカウントダウンが終わって読み上げが始まったところから測る
+        st.session_state.update({'correct_ans': sum(problems[q_no]), 'player': player, 'current_q': q_no, 'last_voice_id': voice_id,
+                                 'played_at': time.time() + remaining_ms / 1000})
+        stages['play_click'] = time.time() - countdown_started
+        record_play(stages, q_no, actual_voice_id, len(audio_src) if audio_src.startswith("data:") else len(audio_bytes))
     except Exception as e: 
+        REGISTRY.inc("play_errors_total")
+        countdown_placeholder.empty()
         loading_placeholder.error("エラーが発生しました")
         st.error(f"Error: {e}")
 
+# --- 模擬試験（範囲内の問題を1本の音声として通しで読み上げる） ---
+# 問題ごとのクリップを共有のループで並行して作り、プレーヤーはできたクリップから順に再生していく
+def cancel_exam():
+    exam = st.session_state.get('exam')
+    if exam:
+        exam['cancel'].set()
+        exam['future'].cancel()
+    st.session_state['exam'] = None
+
+def start_exam(exam_problems, voice_id, answer_gap, assemble=False):
+    cancel_exam()
+    voice = pick_voice(voice_id)
+    cancel_event = threading.Event()
+    service = get_tts_service()
+    future = service.submit(exam_audio.render_exam(
+        get_audio_cache(), service.backend, exam_problems, voice, answer_gap, assemble,
+        SEGMENT_GAPS, SEGMENT_CONCURRENCY, AUDIO_FORMAT, cancel_event, EXAM_CONCURRENCY))
+    keys = [exam_audio.exam_clip_key(no, nums, voice, answer_gap, assemble, AUDIO_FORMAT, SEGMENT_GAPS) for no, nums in exam_problems]
+    REGISTRY.inc("exams_total")
+    st.session_state['exam'] = {'problems': exam_problems, 'voice': voice, 'keys': keys, 'future': future,
+                                'cancel': cancel_event, 'started': time.time()}
+
+# 再実行でプレーヤーを作り直さない (読み上げを最初からやり直さない) よう、id は試験ごとに固定する
+def exam_player_html(urls, base_speed, exam_id):
+    player_id = f"exam_{exam_id}"
+    return f"""
+        <div class="custom-card">
+            <div id="st_{player_id}" style="color: #718096; font-size: 0.9em; margin-bottom: 6px;">Preparing 1 / {len(urls)}...</div>
+            <audio id="{player_id}" controls style="width: 100%;"></audio>
+        </div>
+        <script>
+            var urls = {urls!r};
+            var audio = document.getElementById("{player_id}");
+            var status = document.getElementById("st_{player_id}");
+            var index = 0;
+            function playNext() {{
+                if (index >= urls.length) {{ status.innerText = "Finished"; return; }}
+                fetch(urls[index], {{method: "HEAD", cache: "no-store"}}).then(function(r) {{
+                    if (!r.ok) throw 0;
+                    status.innerText = (index + 1) + " / " + urls.length;
+                    audio.src = urls[index];
+                    audio.playbackRate = {base_speed};
+                    audio.play().catch(function() {{}});
+                }}).catch(function() {{
+                    status.innerText = "Preparing " + (index + 1) + " / " + urls.length + "...";
+                    setTimeout(playNext, {EXAM_POLL_MS});
+                }});
+            }}
+            audio.addEventListener("ended", function() {{ index += 1; playNext(); }});
+            playNext();
+        </script>
+    """
+
+def show_exam(base_speed):
+    exam = st.session_state['exam']
+    cache = get_audio_cache()
+    ready = sum(cache.ensure_file(key) for key in exam['keys'])  # プレーヤーが取りに行けるファイルの数
+    st.progress(ready / len(exam['keys']), text=f"音声の準備: {ready} / {len(exam['keys'])} 問")
+    future = exam['future']
+    static = st.get_option("server.enableStaticServing")
+    if not static:
+        # 静的配信が使えないときは全問そろうのを待って1本の音声として渡す
+        with st.spinner("Generating audio..."): future.exception()  # 終わるまで待つ (例外は下で扱う)
+    error = future.exception() if future.done() and not future.cancelled() else None
+    if error:
+        # 合成に失敗したらプレーヤーを出さない (出したままだと、できないクリップを待ち続ける)
+        if not exam.get('failed'):
+            exam['failed'] = True
+            exam['cancel'].set()
+            REGISTRY.inc("exam_errors_total")
+        st.error(f"Error: {error}")
+    else:
+        st.markdown("### 🎧 Listening...")
+        if static:
+            urls = [AUDIO_URL_BASE + cache.relpath_for(key) for key in exam['keys']]
+            st.components.v1.html(exam_player_html(urls, exam.setdefault('speed', base_speed), int(exam['started'] * 1000)), height=110)
+        track = cache.get(future.result()) if future.done() and future.result() else None
+        if track:
+            if not static: st.audio(track, format="audio/mpeg")
+            st.download_button("💾 試験の音声をダウンロード (MP3)", track, file_name="exam.mp3", mime="audio/mpeg")
+
+    st.divider()
+    st.markdown("#### 📝 解答用紙")
+    with st.form(key=f"exam_sheet_{exam['started']}"):
+        columns = st.columns(3)
+        for i, (no, _) in enumerate(exam['problems']):
+            with columns[i % 3]: st.text_input(f"({i + 1}) 問題 {no}", key=f"exam_in_{exam['started']}_{no}")
+        submitted = st.form_submit_button("答え合わせ", type="secondary", use_container_width=True)
+    if submitted:
+        rows, correct = [], 0
+        for i, (no, nums) in enumerate(exam['problems']):
+            answer = st.session_state.get(f"exam_in_{exam['started']}_{no}", "").replace(",", "").strip()
+            try: ok = int(answer) == sum(nums)
+            except ValueError: ok = False
+            correct += ok
+            rows.append(f"| {i + 1} | {no} | {answer or '-'} | {sum(nums):,} | {'⭕' if ok else '❌'} |")
+        st.success(f"{len(rows)} 問中 {correct} 問正解です")
+        st.markdown("| # | 問題 | あなたの答え | 正解 | |\n|---|---|---|---|---|\n" + "\n".join(rows))
+
+# --- 画面の部品 (操作したときにその部分だけを再実行する) ---
+def current_speed():
+    return 0.5 + st.session_state.get('speed_level', 10) * 0.1
+
+# スライダーを動かしても設定の表示だけを作り直す (速さは次に再生するときに読む)
+@st.fragment
+def speed_control():
+    st.subheader("🕰️ 基本スピード")
+    st.slider("Level (0.6x - 2.5x)", 1, 20, 10, key="speed_level", help="ここでの設定は次の問題にも引き継がれます")
+    st.caption(f"現在の設定: **{current_speed():.1f}倍速**")
+
+# 問題の桁数と引き算の有無 (問題セットの索引にある値を使うので、数字を読み直さない)
+def problem_info(problems, q_no):
+    low, high = problems.digit_range(q_no)
+    return f"📊 {low}〜{high}桁  |  ⚙️ {'加減算' if problems.has_subtraction(q_no) else '加算のみ'}"
+
+# 答えの確認用の数字の一覧 (問題の数字が同じなら作り直さない)
+@st.cache_data(max_entries=4096)
+def problem_reveal(nums):
+    html_nums = "".join([f"<div class='number-display'>{n:,}</div>" for n in nums])
+    reveal = f"""
+            <div class="custom-card">
+                {html_nums}
+                <div style='text-align: right; font-weight: bold; font-size: 1.2em; margin-top: 5px; color: inherit;'>Total: {sum(nums):,}</div>
+            </div>
+            """
+    return reveal
+
+# 再生ボタンとプレーヤー。同じ問題の聞き直しはこの部分だけを再実行する
+@st.fragment
+def player_panel(q_no, problems, voice_id, assemble, show_play_button):
+    if show_play_button and st.button("▶️ 再生する (Play)", type="primary", use_container_width=True):
+        replay = st.session_state['correct_ans'] is not None and st.session_state['current_q'] == q_no
+        _, voice = take_prefetched(q_no) or (None, None)
+        create_and_play_audio(q_no, problems, voice_id, current_speed(), voice, assemble)
+        st.rerun(scope="fragment" if replay else "app")  # 初めて聞く問題は解答欄を出すので画面全体を作り直す
+
+    if player := st.session_state['player']:
+        st.markdown("### 🎧 Listening...")
+        html_started = time.perf_counter()
+        st.components.v1.html(player_html(player), height=130)
+        # 再生1回ごとの段階として、プレーヤーを初めて出したときの HTML の組み立てと描画を測る
+        if not player.get('rendered'):
+            player['rendered'] = True
+            REGISTRY.observe("stage_seconds", time.perf_counter() - html_started, stage="html")
+
+# 答え合わせ1回分を記録する (同じ問題を何回目に答えたかも残す)
+# 問題番号はCSVを替えたりモードを切り替えたりすると別の問題を指すので、回数は問題の数字で見分ける。
+# 数えるのは今の問題の分だけ (ランダム生成では問題が毎回新しいので、過去の問題の回数は持たない)
+def record_attempt(q_no, correct, mode):
+    player = st.session_state['player']
+    if not STATS_DIR or not player: return
+    problem = (mode, tuple(player['nums']))
+    last, count = st.session_state.get('attempts') or (None, 0)
+    count = count + 1 if last == problem else 1
+    st.session_state['attempts'] = (problem, count)
+    seconds = max(0.0, time.time() - st.session_state.get('played_at', time.time()))
+    try:
+        get_learner_stats().record(session_id(), q_no, player['nums'], player['voice'], player['speed'], correct,
+                                   seconds, count, "random" if mode == "ランダム生成" else "csv")
+    except OSError:
+        REGISTRY.inc("stats_errors_total")  # 記録できなくても答え合わせは続ける
+
+# 答え合わせは比較だけで済ませる (画面全体は作り直さない)
+@st.fragment
+def answer_form(q_no, mode):
+    with st.form(key=f'ans_form_{q_no}'): 
+        user_input = st.text_input("答えを入力:", key=f"in_{q_no}")
+        if st.form_submit_button("答え合わせ", type="secondary", use_container_width=True):
+            try: val = int(user_input.replace(",", "").strip())
+            except ValueError: st.warning("数字を入力してください。")
+            else:
+                if val == st.session_state['correct_ans']:
+                    st.success(f"正解です ✨ {val:,}")
+                else: st.error(f"残念... 正解は {st.session_state['correct_ans']:,} でした。")
+                record_attempt(q_no, val == st.session_state['correct_ans'], mode)
+
+# 全員分の答え合わせの集計 (先生用)
+def show_stats_panel():
+    stats = get_learner_stats()
+    stats.refresh()  # 他のプロセスが記録した分も取り込む
+    with st.expander("📊 学習の記録 (先生用)"):
+        total = stats.query("all")
+        if not total:
+            st.caption("まだ記録がありません")
+            return
+        st.caption(f"{total[0]['attempts']:,} 回 / 正答率 {total[0]['accuracy']:.0%} ({len(stats.days())} 日分)")
+        labels = {'digits': "桁数", 'rows': "口数", 'subtraction': "引き算", 'voice': "声", 'speed': "速さ"}
+        dimension = st.selectbox("切り口", DIMENSIONS, format_func=labels.get, key="stats_dimension")
+        rows = [f"| {row['value']} | {row['attempts']:,} | {row['accuracy']:.0%} | "
+                + (f"{row['mean_seconds']:.1f}" if row['mean_seconds'] is not None else "-") + " |"
+                for row in stats.query(dimension)]
+        st.markdown(f"| {labels[dimension]} | 回数 | 正答率 | 平均時間 (秒) |\n|---|---|---|---|\n" + "\n".join(rows))
+
 def reset_audio_state():
     st.session_state.update({
-        'audio_html': None, 
+        'player': None, 
         'correct_ans': None, 
         'current_q': None, 
         'last_voice_id': None,
-        'generated_problems': {} 
+        'generated_problems': {},
+        'attempts': None
     })
+    get_session_store().release(session_id())
+    cancel_prefetch()
+    cancel_fanout()
+    cancel_exam()
 
 # --- メイン UI ---
 st.set_page_config(page_title=APP_NAME_EN, layout="centered", initial_sidebar_state="expanded")
 set_bg_image(BG_IMAGE)
 st.title(APP_NAME_EN)
 st.markdown(f"##### {APP_NAME_JP}")
+record_startup()
 
-for key in ['correct_ans', 'current_q', 'audio_html', 'last_voice_id', 'generated_problems', 'digit_deck']:
-    if key not in st.session_state: st.session_state[key] = None if 'ans' in key or 'html' in key or 'voice' in key or 'q' in key else [] if 'deck' in key else {}
+for key in ['correct_ans', 'current_q', 'player', 'last_voice_id', 'generated_problems', 'digit_deck']:
+    if key not in st.session_state: st.session_state[key] = None if key in ('correct_ans', 'current_q', 'player', 'last_voice_id') else [] if 'deck' in key else {}
+get_session_store().touch(session_id())  # ときどき、しばらく操作のないセッションの音声の参照を外す
 
 with st.expander("📖 使いかた", expanded=False):
     st.markdown("""
     1. **設定**: 左側で**『モード』**と**『声』**を選びます。
     2. **スピード**: 左側の**『基本スピード』**で好みの速さを決めておくと、ずっとその速さで再生されます。
-    3. **再生**: **『再生する』**ボタンを押すと、読み込み → **3秒カウントダウン** → 音声再生となります。
+    3. **再生**: **『再生する』**ボタンを押すと、読み込みと同時に**3秒カウントダウン**が始まり、終わり次第音声が再生されます。
     4. **答え合わせ**: 答えを入力して**『答え合わせ』**を押してください。
     """)
 
 file_counts = get_problem_counts()
 with st.sidebar:
     st.header("⚙️ 設定 (Settings)")
-    mode = st.radio("📁 モード選択", ["ランダム生成", "CSV読み込み"], on_change=reset_audio_state)
+    mode = st.radio("📁 モード選択", ["ランダム生成", "CSV読み込み", "模擬試験"], on_change=reset_audio_state)
+    source = st.radio("出題元", ["CSV読み込み", "ランダム生成"], horizontal=True) if mode == "模擬試験" else mode
     st.divider()
     
-    st.subheader("🕰️ 基本スピード")
-    speed_level = st.slider("Level (0.6x - 2.5x)", 1, 20, 10, help="ここでの設定は次の問題にも引き継がれます")
-    base_speed = 0.5 + (speed_level * 0.1)
-    st.caption(f"現在の設定: **{base_speed:.1f}倍速**")
+    speed_control()
+    base_speed = current_speed()
     st.divider()
 
-    if mode == "CSV読み込み":
-        selected_file = st.selectbox("年度を選択", options=list(file_counts.keys()), format_func=lambda x: f"{x} ({file_counts.get(x, 0)}問)")
+    if source == "CSV読み込み":
+        selected_file = st.selectbox("年度を選択", options=list(file_counts.keys()), format_func=lambda x: f"{x} ({file_counts.get(x, 0)}問)",
+                                     on_change=lambda: st.session_state.update({'attempts': None}))
         problems = load_problems_from_csv(selected_file)
     else:
         min_d, max_d = st.number_input("最小桁数", 1, 16, 7), st.number_input("最大桁数", 1, 16, 14)
         rows_count = st.slider("口数 (行数)", 3, 15, 5)
         allow_sub = st.checkbox("引き算を含める", value=False)
-        problems = st.session_state['generated_problems']
+        problems = ProblemSet.from_dict(st.session_state['generated_problems'])
+    if mode == "模擬試験":
+        exam_count = st.number_input("問題数", 1, EXAM_MAX_PROBLEMS, 30)
+        if source == "CSV読み込み" and problems:
+            exam_start = st.number_input("最初の問題番号", problems.min_no, problems.max_no, problems.min_no)
+        answer_gap = st.slider("解答時間 (秒)", 3, 60, 15, help="各問題の読み上げのあとに空ける時間です")
     st.divider()
     selected_voice_label = st.selectbox("話者の声を選択", options=list(VOICE_MAP.keys()))
     selected_voice_id = VOICE_MAP[selected_voice_label]
+    fanout_labels = st.multiselect("まとめて用意しておく声", options=[label for label in VOICE_MAP if VOICE_MAP[label] != "random"],
+                                   help="問題を選んだ時点でこれらの声の音声をまとめて作っておき、声の切り替えや 🎲 ランダムの引き直しをすぐに再生できるようにします")
+    fanout_voice_ids = [VOICE_MAP[label] for label in fanout_labels]
+    if ADMIN_PANEL:
+        st.divider()
+        show_admin_panel()
+        if STATS_DIR: show_stats_panel()
 
 # メイン処理
+use_segments = SEGMENT_AUDIO_IN_RANDOM_MODE and source == "ランダム生成"
+
+if mode == "模擬試験":
+    if st.button("▶️ 試験を始める (Start)", type="primary", use_container_width=True):
+        if source == "CSV読み込み":
+            exam_nos = itertools.islice((no for no in problems if no >= exam_start), exam_count)
+            exam_problems = [(no, problems[no]) for no in exam_nos]
+        else:
+            try: exam_problems = list(batch_to_problems(generate_problems(exam_count, min_d, max_d, rows_count, allow_sub)).items())
+            except ValueError as e: st.warning(str(e)); st.stop()
+        if exam_problems: start_exam(exam_problems, selected_voice_id, answer_gap, use_segments)
+        else: st.warning("問題がありません。")
+    if st.session_state.get('exam'): show_exam(base_speed)
+    st.stop()
+
+if mode == "ランダム生成":
+    prefetch = sync_prefetch(('random', selected_voice_id, min_d, max_d, rows_count, allow_sub))
+else:
+    prefetch = sync_prefetch(('csv', selected_file, selected_voice_id))
+
 if is_random_mode := (mode == "ランダム生成"):
     if not problems:
         if st.button("▶️ 再生する (Play)", type="primary", use_container_width=True):
-            st.session_state['generated_problems'] = {1: generate_single_problem(min_d, max_d, rows_count, allow_sub)}
-            create_and_play_audio(1, st.session_state['generated_problems'], selected_voice_id, base_speed); st.rerun()
+            try: st.session_state['generated_problems'] = {1: generate_single_problem(min_d, max_d, rows_count, allow_sub)}
+            except ValueError as e: st.warning(str(e)); st.stop()
+            create_and_play_audio(1, st.session_state['generated_problems'], selected_voice_id, base_speed, assemble=use_segments); st.rerun()
         st.stop()
 
 if problems:
-    min_no, max_no = min(problems.keys()), max(problems.keys())
+    min_no, max_no = problems.min_no, problems.max_no
     st.markdown("---")
     
     current_q_val = st.session_state.get('current_q')
@@ -466,51 +862,43 @@ if problems:
     q_no = st.number_input("📝 問題番号", min_value=min_no, max_value=max_no, value=default_val, key=f"q_selector_{mode}")
     
     if q_no in problems:
-        d_info = [len(str(abs(n))) for n in problems[q_no]]
-        p_type = any(n < 0 for n in problems[q_no])
-        
-        type_str = "加減算" if p_type else "加算のみ"
-        st.info(f"📊 {min(d_info)}〜{max(d_info)}桁  |  ⚙️ {type_str}")
+        st.info(problem_info(problems, q_no))
+        reveal = problem_reveal(tuple(problems[q_no]))
 
     if st.session_state['current_q'] != q_no:
-        st.session_state.update({'correct_ans': None, 'audio_html': None, 'current_q': q_no, 'last_voice_id': None})
+        st.session_state.update({'correct_ans': None, 'player': None, 'current_q': q_no, 'last_voice_id': None})
+    sync_fanout(problems[q_no] if q_no in problems else [], fanout_voice_ids, use_segments)
     
-    if st.session_state['audio_html'] and st.session_state['last_voice_id'] != selected_voice_id:
-        create_and_play_audio(q_no, problems, selected_voice_id, base_speed); st.rerun()
+    if st.session_state['player'] and st.session_state['last_voice_id'] != selected_voice_id:
+        create_and_play_audio(q_no, problems, selected_voice_id, base_speed, assemble=use_segments); st.rerun()
 
     st.markdown("<br>", unsafe_allow_html=True)
     
-    if is_random_mode and q_no == max_no:
+    if is_latest_random := (is_random_mode and q_no == max_no):
         if st.button("🆕 次の問題を出す", type="primary", use_container_width=True):
             new_q = max_no + 1
-            st.session_state['generated_problems'] = {new_q: generate_single_problem(min_d, max_d, rows_count, allow_sub)}
-            create_and_play_audio(new_q, st.session_state['generated_problems'], selected_voice_id, base_speed); st.rerun()
-    else:
-        if st.button("▶️ 再生する (Play)", type="primary", use_container_width=True):
-            create_and_play_audio(q_no, problems, selected_voice_id, base_speed); st.rerun()
-
-    if st.session_state['audio_html']:
-        st.markdown("### 🎧 Listening...")
-        st.components.v1.html(st.session_state['audio_html'], height=130)
+            try: nums, voice = take_prefetched(new_q) or (generate_single_problem(min_d, max_d, rows_count, allow_sub), None)
+            except ValueError as e: st.warning(str(e)); st.stop()
+            cancel_fanout()  # 前の問題の声のまとめ準備が、新しい問題の合成と同時合成数の枠を取り合わないように
+            st.session_state['generated_problems'] = {new_q: nums}
+            create_and_play_audio(new_q, st.session_state['generated_problems'], selected_voice_id, base_speed, voice, use_segments); st.rerun()
+    player_panel(q_no, problems, selected_voice_id, use_segments, show_play_button=not is_latest_random)
 
     with st.expander("📜 問題の数字を確認する"):
-        if q_no in problems:
-            html_nums = "".join([f"<div class='number-display'>{n:,}</div>" for n in problems[q_no]])
-            st.markdown(f"""
-            <div class="custom-card">
-                {html_nums}
-                <div style='text-align: right; font-weight: bold; font-size: 1.2em; margin-top: 5px; color: inherit;'>Total: {sum(problems[q_no]):,}</div>
-            </div>
-            """, unsafe_allow_html=True)
+        if q_no in problems: st.markdown(reveal, unsafe_allow_html=True)
 
     if st.session_state['correct_ans'] is not None:
+        # 解答中に次の問題（ランダムは問題そのものも）を先に用意しておく
+        next_qs = list(range(max_no + 1 if is_random_mode else q_no + 1, (max_no if is_random_mode else q_no) + 1 + PREFETCH_DEPTH))
+        drop_prefetched(prefetch, next_qs)
+        for next_q in next_qs:
+            if next_q in prefetch['items']: continue
+            if is_random_mode:
+                try: nums = generate_single_problem(min_d, max_d, rows_count, allow_sub)
+                except ValueError: break  # 桁数の指定が正しくないあいだは先読みしない
+                schedule_prefetch(prefetch, next_q, nums, selected_voice_id, use_segments)
+            elif next_q in problems:
+                schedule_prefetch(prefetch, next_q, problems[next_q], selected_voice_id)
+
         st.divider()
-        with st.form(key=f'ans_form_{q_no}'): 
-            user_input = st.text_input("答えを入力:", key=f"in_{q_no}")
-            if st.form_submit_button("答え合わせ", type="secondary", use_container_width=True):
-                try:
-                    val = int(user_input.replace(",", "").strip())
-                    if val == st.session_state['correct_ans']:
-                        st.success(f"正解です ✨ {val:,}")
-                    else: st.error(f"残念... 正解は {st.session_state['correct_ans']:,} でした。")
-                except: st.warning("数字を入力してください。")
+        answer_form(q_no, mode)